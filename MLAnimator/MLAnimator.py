@@ -6,36 +6,1157 @@
 # Using --reverse (-r), animation will be reversed
 # Using --mirror (-m), animation will include mirrored file list appending (mirrored file list makes the looping animation seemless, but doubles the file size)
 # Using --info (-i), the frame information will be added to the file name
-
-from os import listdir, mkdir, path, rename, scandir, getcwd
+# Using --jobs (-j <number>), that many folders will be encoded by FFMPEG at the same time
+# Using --rendertext (-rt), a second animation is made with frame info drawn on each frame. --rendertext_fields (-rtf frame,index,filename) picks what is drawn, --save_text_frames (-rts) also saves the drawn frames as images
+# Using --watch (-w), new files are sorted as they are written and a preview of the latest frames of each prompt is kept up to date (--preview_frames, --debounce, --preview_interval)
+# Using --incremental (-inc), only frames added since the last run are encoded into a new segment, and the animation is rebuilt from its segments without re-encoding
+# Using --skip_unchanged (-sk) with --all, folders that haven't changed since they were animated with the same settings are skipped. Rendered folders are kept in AnimatorOutput/catalog.sqlite3
+# Using the query command (MLAnimator.py query -dir <dir>), the folders that still need animating are listed
+# Using --chunks (-ch <number>), each animation is split into that many chunks that are encoded at the same time and joined without re-encoding (0 uses every core)
+# Using --ranges (-rg <start:end:step,...>), several animations are made from one folder with a single FFMPEG decode. Frames are counted from 1 and negative numbers count back from the last frame (1:100 is the first 100 frames, -200: is the last 200, ::10 is every 10th frame)
+# Using --frame_cache (-fc), each folder's frames are decoded once into a memory-mapped file that later encodes read from (--cache_size limits its size in MB)
+# Using --dry_run (-dr), the files that would be sorted are listed without moving anything
+# Using --metrics <file>, the time, frames per second and bytes written of each stage (scan, sort, select, overlay, encode) of each folder are added to a JSON lines file, along with FFMPEG's progress
+# Using --progress (-pr), FFMPEG's progress is shown while encoding. Using --profile_stage <stage>, that stage is run under cProfile and saved to AnimatorOutput/profiles
+# Using --overwrite (-ow <prompt|new|overwrite|skip>), existing animations are asked about, given a new numbered name, replaced or skipped. Only prompt asks for input
+# Animator runs AnimationJobs in another program without any input, reusing its directory scan and FFMPEG workers between jobs and returning AnimationResults
+# Using --dedup (-dd <bits>), frames that look nearly the same as the last kept frame are dropped. Using --target_frames (-tf <amount>), that many frames are kept, spread over how much the frames change
+# An archive (zip or tar) can be used as the directory, its frames are grouped by prefix and streamed from it without extracting or moving anything
+# Using --prefetch (-pre <threads>), frames are read ahead on that many threads, up to --prefetch_window frames ahead, for frames on slow or network drives
+# Using --outputs (-out <filetype[:width],...>), several file types and sizes are made from one decode of the frames, each in its own AnimatorOutput/<dir>_<filetype>_output folder
+# Using -ft sheet or -ft atlas, the selected frames are tiled into pages of PNG images with a JSON index of where each frame is, sheets also label each tile with its frame number
+# FrameSink encodes frames pushed by a training loop straight into AnimatorOutput, with optional PNG checkpoints every Nth frame
+# Using --encoder (-enc <pipe|concat>), frames are either streamed to FFMPEG through a pipe (default) or listed in a concat file written to the frame folder
+
+from os import listdir, mkdir, path, rename, scandir, getcwd, cpu_count, replace, read, close, fsdecode, fsencode, remove, stat, utime, fsync, O_CLOEXEC, O_CREAT, O_EXCL, O_WRONLY
+from os import open as os_open
 from os.path import isfile, join, splitext
 import sys
 import subprocess
 import argparse
+import threading
+import time
+import select
+import struct
+import ctypes
+import ctypes.util
+import json
+import sqlite3
+import shutil
+import tempfile
+import hashlib
+import queue
+import io
+import zipfile
+import tarfile
+import cProfile
+from contextlib import contextmanager
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image, ImageDraw, ImageFont
 from pathlib import Path
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 image_file_types = ['png', 'jpg']
+encoder_types = ['pipe', 'concat']
+overwrite_policies = ['prompt', 'new', 'overwrite', 'skip']
+text_field_types = ['frame', 'index', 'filename']
+# output types whose encoded segments can be joined by FFMPEG without re-encoding
+segment_file_types = ['mp4', 'mkv', 'mov']
+# images of tiled frames with a JSON index of the tiles, made instead of an animation
+sheet_file_types = ['sheet', 'atlas']
+archive_file_types = ['.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz']
+font_path = '/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf'
+
+class FrameFolder:
+    # Frames of one sorted folder. Frame numbers are parsed once and kept in a compact array,
+    # the sorted order is worked out from them when it is first needed.
+    def __init__(self, folderpath, prefix):
+        self.path = folderpath
+        self.name = prefix
+        self.prefix = prefix
+        self.ext = None
+        self.names = []
+        self.numbers = array('q')
+        self.order = None
+        self.loaded = False
+        # every image in the folder, including ones that don't belong to the folder's prefix
+        self.image_count = 0
+
+    def load(self):
+        if self.loaded:
+            return self
+        for f in scandir(self.path):
+            if f.is_file():
+                self.add(f.name, *FrameIndex.parse_name(f.name))
+        self.loaded = True
+        return self
+
+    def add(self, filename, prefix, num, ext):
+        if ext not in image_file_types:
+            return
+        self.image_count += 1
+        if prefix is None or prefix != self.prefix:
+            return
+        if self.ext is None:
+            self.ext = ext
+        self.names.append(filename)
+        self.numbers.append(num)
+        self.order = None
+
+    def sorted_order(self):
+        if self.order is None:
+            numbers = self.numbers
+            self.order = array('l', sorted(range(len(numbers)), key=numbers.__getitem__))
+        return self.order
+
+    def files(self):
+        self.load()
+        return [path.join(self.path, self.names[i]) for i in self.sorted_order()]
+
+    def frame_numbers(self):
+        self.load()
+        return array('q', (self.numbers[i] for i in self.sorted_order()))
+
+    def __len__(self):
+        self.load()
+        return len(self.numbers)
+
+    def mtime_ns(self):
+        return stat(self.path).st_mtime_ns
+
+def is_archive(filepath):
+    return path.isfile(filepath) and filepath.lower().endswith(tuple(archive_file_types))
+
+def archive_name(filepath):
+    # name of an archive without its extension, for its output folder
+    name = path.basename(filepath)
+    for ext in sorted(archive_file_types, key=len, reverse=True):
+        if name.lower().endswith(ext):
+            return name[:-len(ext)]
+    return name
+
+def open_frame(f):
+    # frames are opened from their archive when they're in one, otherwise from the disk.
+    # PIL doesn't close file objects it's given, so the caller closes it with a with block
+    if isinstance(f, ArchiveMember):
+        return f.open()
+    return open(f, "rb")
+
+def frame_stat(f):
+    if isinstance(f, ArchiveMember):
+        return f
+    return stat(f)
+
+class FrameArchive:
+    # A zip or tar archive of frames that's read in place. Tar archives can only be read by one thread at a time,
+    # so their members are read under a lock.
+    def __init__(self, archivepath):
+        self.path = path.abspath(archivepath)
+        self.mtime_ns = stat(archivepath).st_mtime_ns
+        self.lock = threading.Lock()
+        self.zip = self.tar = None
+        if zipfile.is_zipfile(archivepath):
+            self.zip = zipfile.ZipFile(archivepath)
+            self.members = [(info.filename, info.file_size) for info in self.zip.infolist() if not info.is_dir()]
+        else:
+            self.tar = tarfile.open(archivepath)
+            self.tar_members = {m.name: m for m in self.tar.getmembers() if m.isfile()}
+            self.members = [(m.name, m.size) for m in self.tar_members.values()]
+
+    def read(self, member):
+        if self.zip:
+            return io.BytesIO(self.zip.read(member))
+        with self.lock:
+            return io.BytesIO(self.tar.extractfile(self.tar_members[member]).read())
+
+    def close(self):
+        (self.zip or self.tar).close()
+
+class FramePrefetcher:
+    # Reads the upcoming frames on a pool of threads, so frames on slow or network drives are read as fast as the drive's
+    # bandwidth allows instead of waiting on each open in turn. At most `window` frames are read ahead of the one being used.
+    def __init__(self, workers=8, window=32):
+        self.workers = workers
+        self.window = max(window, workers)
+
+    def read(self, file_list):
+        # yields the bytes of each frame in order
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            try:
+                for f in file_list:
+                    pending.append(pool.submit(self.read_frame, f))
+                    if len(pending) >= self.window:
+                        yield pending.popleft().result()
+
+                while pending:
+                    yield pending.popleft().result()
+            finally:
+                # reads that haven't started aren't needed once the frames stop being used
+                for future in pending:
+                    future.cancel()
+
+    def read_frame(self, f):
+        with open_frame(f) as fh:
+            return fh.read()
+
+class ArchiveMember(str):
+    # A frame in an archive. It reads as the archive's path joined with the member's name, has the stat fields the frame cache
+    # and frame hashes check, and is opened from the archive instead of the disk.
+    def __new__(cls, archive, member, size):
+        self = str.__new__(cls, path.join(archive.path, member))
+        self.archive = archive
+        self.member = member
+        self.st_size = size
+        self.st_mtime_ns = archive.mtime_ns
+        return self
+
+    def open(self):
+        return self.archive.read(self.member)
+
+class ArchiveFolder(FrameFolder):
+    # Frames of one prefix in an archive, wherever they are in it, so archives are sorted without moving anything
+    def __init__(self, archive, prefix):
+        FrameFolder.__init__(self, path.join(archive.path, prefix), prefix)
+        self.archive = archive
+        self.members = {}
+        self.loaded = True
+
+    def add_member(self, member, prefix, num, ext):
+        self.members[member.member] = member
+        self.add(member.member, prefix, num, ext)
+
+    def files(self):
+        return [self.members[self.names[i]] for i in self.sorted_order()]
+
+    def mtime_ns(self):
+        return self.archive.mtime_ns
+
+class ArchiveIndex:
+    # Index of the frames in a zip or tar archive, grouped into a virtual sorted folder per prefix from one pass over the member names.
+    # Nothing in an archive is left to sort, so files is always empty.
+    def __init__(self, archivepath):
+        self.archive = FrameArchive(archivepath)
+        self.dir = self.archive.path
+        self.files = []
+        self.parsed = {}
+        self.folders = {}
+        self.misc_count = 0
+
+        for member, size in self.archive.members:
+            prefix, num, ext = FrameIndex.parse_name(path.basename(member))
+            if ext not in image_file_types:
+                continue
+            if not prefix:
+                self.misc_count += 1
+                continue
+            if prefix not in self.folders:
+                self.folders[prefix] = ArchiveFolder(self.archive, prefix)
+            self.folders[prefix].add_member(ArchiveMember(self.archive, member, size), prefix, num, ext)
+
+    def folder_list(self):
+        return list(self.folders.values())
+
+class FrameIndex:
+    # Index of a run directory made from a single scan. Sorted folders are only scanned when their frames are asked for,
+    # and files moved while sorting are added to the index instead of scanning the folders again.
+    def __init__(self, dir):
+        self.dir = dir
+        self.files = []
+        self.parsed = {}
+        self.folders = {}
+
+        for f in scandir(dir):
+            if f.is_dir():
+                if f.name != "Unsorted_Files":
+                    self.folders[f.name] = FrameFolder(f.path, f.name)
+            elif f.is_file():
+                parsed = self.parse_name(f.name)
+                if parsed[2] in image_file_types:
+                    self.files.append(f.name)
+                    self.parsed[f.name] = parsed
+
+    @staticmethod
+    def parse_name(filename):
+        # same naming rules as get_filename and get_file_num, done with a single split
+        namestr = filename.split(".")
+        if namestr[len(namestr) - 2].isnumeric():
+            return "".join(namestr[:-2]), int(namestr[-2]), namestr[-1]
+        return None, None, namestr[-1]
+
+    def prefix(self, filename):
+        return self.parsed[filename][0]
+
+    def root_folder(self, prefix):
+        folder = FrameFolder(self.dir, prefix)
+        for f in self.files:
+            folder.add(f, *self.parsed[f])
+        folder.loaded = True
+        return folder
+
+    def add_file(self, filename):
+        # records a file that showed up after the scan, returns its prefix or None if it isn't a compatible image
+        parsed = self.parse_name(filename)
+        if parsed[2] not in image_file_types:
+            return None
+        if filename not in self.parsed:
+            self.files.append(filename)
+        self.parsed[filename] = parsed
+        return parsed[0]
+
+    def add_sorted_file(self, filename, sortedname):
+        folder = self.folders.get(sortedname)
+        if folder is None:
+            # folder was just made by sorting, so this index already knows everything in it
+            folder = FrameFolder(path.join(self.dir, sortedname), sortedname)
+            folder.loaded = True
+            self.folders[sortedname] = folder
+        if folder.loaded:
+            folder.add(filename, *self.parsed[filename])
+
+    def folder_list(self):
+        return list(self.folders.values())
+
+class NameAllocator:
+    # Hands out unused "name.ext", "name(1).ext", ... paths. Each directory is listed once for the highest index of every name,
+    # and the next index is handed out from there, so folders with thousands of numbered animations are never checked name by name.
+    # Files are made empty with O_EXCL and folders with mkdir, so a name another process took since the listing is passed over
+    # instead of written over. A file made this way is removed again by settle() if nothing was saved to it.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.next_index = {}
+        self.claimed = set()
+        self.reserved = set()
+
+    @staticmethod
+    def split_index(name):
+        # "name(3)" is ("name", 3), anything else is an index of 0
+        if name.endswith(")") and "(" in name:
+            base, _, index = name[:-1].rpartition("(")
+            if index.isnumeric():
+                return base, int(index)
+        return name, 0
+
+    def scan(self, dirpath):
+        indexes = {}
+        for entry in listdir(dirpath):
+            # every name is counted both as a folder name and as a file name with an extension
+            stem, ext = splitext(entry)
+            for base, index, key_ext in (self.split_index(entry) + ("",), self.split_index(stem) + (ext[1:],)):
+                key = (base, key_ext)
+                indexes[key] = max(indexes.get(key, 0), index + 1)
+        self.next_index[dirpath] = indexes
+        return indexes
+
+    def allocate(self, dirpath, basename, ext, create):
+        with self.lock:
+            indexes = self.next_index.get(dirpath)
+            if indexes is None:
+                indexes = self.scan(dirpath)
+            index = indexes.get((basename, ext), 0)
+            while True:
+                name = basename if index == 0 else "%s(%d)" % (basename, index)
+                newpath = path.join(dirpath, "%s.%s" % (name, ext) if ext else name)
+                try:
+                    create(newpath)
+                except FileExistsError:
+                    index += 1
+                    continue
+                indexes[(basename, ext)] = index + 1
+                self.claimed.add(newpath)
+                return newpath
+
+    def new_file(self, dirpath, basename, ext):
+        # the file is left empty for FFMPEG to write over
+        newpath = self.allocate(dirpath, basename, ext, lambda newpath: close(os_open(newpath, O_CREAT | O_EXCL | O_WRONLY, 0o666)))
+        with self.lock:
+            self.reserved.add(newpath)
+        return newpath
+
+    def settle(self, filepath, saved):
+        # a file made by new_file is kept once its output is saved, and removed when it failed so it isn't taken for a finished one
+        with self.lock:
+            reserved = filepath in self.reserved
+            self.reserved.discard(filepath)
+        if reserved and not saved and isfile(filepath):
+            remove(filepath)
+
+    def new_dir(self, dirpath, basename):
+        return self.allocate(dirpath, basename, "", mkdir)
+
+    def claim(self, filepath):
+        # claims a path to write over, False if this run already has it
+        with self.lock:
+            if filepath in self.claimed:
+                return False
+            self.claimed.add(filepath)
+            return True
 
-class MLAnimator:
-    def __init__(self, dir, framerate, starting_frame, frames, filetype, animate, reverse, mirror_list, info, all, Render_Frame_Text=False):
-        animator_output_path = path.join(getcwd(), "AnimatorOutput")
+    def is_claimed(self, filepath):
+        return filepath in self.claimed
+
+    def release(self, filepath):
+        with self.lock:
+            self.claimed.discard(filepath)
+
+class SortPlan:
+    # Every move needed to sort a run directory, worked out from one FrameIndex scan before anything is moved.
+    # Moves are written to a journal in the directory first, so an interrupted sort is finished by the next run.
+    journal_name = ".mlanimator_sort_journal"
+
+    def __init__(self, index):
+        self.index = index
+        self.dir = index.dir
+        self.moves = []
+        self.conflicts = []
+        self.new_folders = []
+
+        prefixes = set(index.prefix(f) for f in index.files)
+        # a folder of one prompt's frames and no other folders is already sorted
+        self.sorted_folder = len(index.files) > 0 and len(index.folders) == 0 and len(prefixes) == 1 and None not in prefixes and "" not in prefixes
+
+        existing = {}
+        for f in index.files:
+            target = index.prefix(f) or "Unsorted_Files"
+            if target not in existing:
+                targetpath = path.join(self.dir, target)
+                if path.isdir(targetpath):
+                    existing[target] = set(listdir(targetpath))
+                else:
+                    existing[target] = set()
+                    self.new_folders.append(target)
+
+            if f in existing[target]:
+                self.conflicts.append((f, target))
+            else:
+                existing[target].add(f)
+                self.moves.append((f, target))
+
+    def misc_count(self):
+        return sum(1 for f, target in self.moves if target == "Unsorted_Files")
+
+    def print_plan(self):
+        for f, target in self.moves:
+            print("%s -> %s" % (f, path.join(target, f)))
+        for f, target in self.conflicts:
+            print("CONFLICT: %s already exists in %s" % (f, target))
+        print("\n%d files to move into %d folders (%d new), %d misc images, %d conflicts." % (
+            len(self.moves), len(set(target for _, target in self.moves)), len(self.new_folders), self.misc_count(), len(self.conflicts)))
+
+    def apply(self, workers=16):
+        journalpath = path.join(self.dir, self.journal_name)
+        with open(journalpath, "w", encoding="utf-8") as journal:
+            journal.write(json.dumps({"moves": self.moves}) + "\n")
+            journal.flush()
+            fsync(journal.fileno())
+
+            for folder in self.new_folders:
+                if not path.exists(path.join(self.dir, folder)):
+                    mkdir(path.join(self.dir, folder))
+
+            lock = threading.Lock()
+            def move(i):
+                f, target = self.moves[i]
+                rename(path.join(self.dir, f), path.join(self.dir, target, f))
+                with lock:
+                    journal.write("%d\n" % i)
+
+            # renames are mostly waiting on the file system, so a pool keeps slow network drives busy
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(move, range(len(self.moves))))
+
+        remove(journalpath)
+
+        for f, target in self.moves:
+            if target != "Unsorted_Files":
+                self.index.add_sorted_file(f, target)
+
+        for f, target in self.conflicts:
+            print("Not sorting %s, a file with that name is already in %s" % (f, target))
+        print("Sorted %d files. (%d misc images)" % (len(self.moves), self.misc_count()))
+
+    @classmethod
+    def resume(cls, dir):
+        # finishes the moves of a sort that was interrupted, returns True if there was one
+        journalpath = path.join(dir, cls.journal_name)
+        if not path.exists(journalpath):
+            return False
+
+        with open(journalpath, "r", encoding="utf-8") as journal:
+            lines = journal.read().splitlines()
+        try:
+            moves = json.loads(lines[0])["moves"]
+        except (IndexError, ValueError, KeyError):
+            # the plan itself wasn't finished being written, so nothing was moved yet
+            remove(journalpath)
+            return False
+
+        done = set(int(line) for line in lines[1:] if line.strip().isnumeric())
+        resumed = 0
+        for i, (f, target) in enumerate(moves):
+            src = path.join(dir, f)
+            dst = path.join(dir, target, f)
+            if i in done or not path.exists(src) or path.exists(dst):
+                continue
+            if not path.exists(path.join(dir, target)):
+                mkdir(path.join(dir, target))
+            rename(src, dst)
+            resumed += 1
+
+        remove(journalpath)
+        print("Finished an interrupted sort of %s. (%d files moved)" % (dir, resumed))
+        return True
+
+class DirectoryWatcher:
+    # Reports files that finish being written into a directory. Uses inotify on Linux and falls back to polling the directory.
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    event_header = struct.Struct("iIII")
+
+    def __init__(self, dir, poll_interval=1.0, use_inotify=True):
+        self.dir = dir
+        self.poll_interval = poll_interval
+        self.fd = None
+        self.pending = {}
+        self.seen = {}
+
+        if use_inotify:
+            try:
+                self.start_inotify()
+            except (OSError, AttributeError) as e:
+                print("inotify unavailable (%s), polling %s instead." % (e, dir))
+                self.fd = None
+
+    def start_inotify(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = libc.inotify_init1(O_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(fd, fsencode(self.dir), self.IN_CLOSE_WRITE | self.IN_MOVED_TO) < 0:
+            close(fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+        self.fd = fd
+
+    def snapshot(self):
+        snapshot = {}
+        for f in scandir(self.dir):
+            if f.is_file():
+                stat = f.stat()
+                snapshot[f.name] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def wait(self, timeout):
+        # returns the names of files that are finished being written, or an empty list after the timeout
+        if self.fd is not None:
+            ready, _, _ = select.select([self.fd], [], [], timeout)
+            if not ready:
+                return []
+            return self.read_events()
+
+        time.sleep(min(timeout, self.poll_interval))
+        return self.poll()
+
+    def read_events(self):
+        data = read(self.fd, 65536)
+        names = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = self.event_header.unpack_from(data, offset)
+            offset += self.event_header.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if name:
+                names.append(fsdecode(name))
+        return names
+
+    def poll(self):
+        # a polled file is only reported once its size and time stay the same between two polls
+        names = []
+        current = self.snapshot()
+        for name, stat in current.items():
+            if self.seen.get(name) == stat:
+                continue
+            if self.pending.get(name) == stat:
+                del self.pending[name]
+                self.seen[name] = stat
+                names.append(name)
+            else:
+                self.pending[name] = stat
+        self.seen = {name: stat for name, stat in self.seen.items() if name in current}
+        return names
+
+    def close(self):
+        if self.fd is not None:
+            close(self.fd)
+            self.fd = None
+
+class AnimatorCatalog:
+    # SQLite catalog of sorted folders and the animations made from them, kept in the main output folder.
+    # A folder's modification time changes when frames are added or removed, but Drive and other FUSE mounts don't always update it,
+    # so the last frame the catalog saw is also checked with a stat, along with the names the frame after it would have.
+    # Nothing is listed or read, so checking a folder takes the same time however many frames it has.
+    def __init__(self, dbpath):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(dbpath, check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS folders (
+                path TEXT PRIMARY KEY, name TEXT, frame_count INTEGER, first_frame INTEGER, last_frame INTEGER,
+                mtime_ns INTEGER, last_file_mtime_ns INTEGER, updated REAL, last_file TEXT);
+            CREATE TABLE IF NOT EXISTS outputs (
+                outpath TEXT PRIMARY KEY, folder_path TEXT, filetype TEXT, framerate INTEGER, starting_frame INTEGER,
+                frames INTEGER, reverse INTEGER, mirror INTEGER, created REAL, width INTEGER);
+            CREATE INDEX IF NOT EXISTS outputs_folder ON outputs (folder_path, filetype, framerate, reverse, mirror);
+            CREATE TABLE IF NOT EXISTS frame_hashes (path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, hash INTEGER);
+        """)
+        # catalogs made before --outputs have no width, all of their outputs are full size
+        if "width" not in [row[1] for row in self.db.execute("PRAGMA table_info(outputs)")]:
+            self.db.execute("ALTER TABLE outputs ADD COLUMN width INTEGER")
+        # older folders have no last file name, only their modification time is checked until they're recorded again
+        if "last_file" not in [row[1] for row in self.db.execute("PRAGMA table_info(folders)")]:
+            self.db.execute("ALTER TABLE folders ADD COLUMN last_file TEXT")
+        self.db.commit()
+
+    def folder(self, folderpath):
+        with self.lock:
+            return self.db.execute("SELECT frame_count, first_frame, last_frame, mtime_ns, last_file_mtime_ns, last_file FROM folders "
+                                   "WHERE path = ?", (path.abspath(folderpath),)).fetchone()
+
+    def record_folder(self, folder, mtime_ns):
+        numbers = folder.frame_numbers()
+        last_file = folder.files()[-1:]
+        # frames in archives are checked by the archive's modification time alone
+        last_file_mtime = frame_stat(last_file[0]).st_mtime_ns if last_file and not isinstance(last_file[0], ArchiveMember) else None
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO folders (path, name, frame_count, first_frame, last_frame, mtime_ns, last_file_mtime_ns, "
+                            "updated, last_file) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            (path.abspath(folder.path), folder.name, len(numbers), numbers[0] if numbers else None,
+                             numbers[-1] if numbers else None, mtime_ns, last_file_mtime, time.time(),
+                             path.basename(last_file[0]) if last_file_mtime is not None else None))
+            self.db.commit()
+
+    def last_file_changed(self, folderpath, last_file, last_file_mtime, frame_count, first_frame, last_frame):
+        # the recorded last frame was changed or removed, or a frame numbered after it is there
+        try:
+            if stat(path.join(folderpath, last_file)).st_mtime_ns != last_file_mtime:
+                return True
+        except OSError:
+            return True
+
+        parts = last_file.split(".")
+        if len(parts) < 2 or not parts[-2].isnumeric():
+            return False
+        # frames can be saved every N iterations, so the step between the recorded frames is tried as well as 1
+        steps = {1}
+        if frame_count > 1 and (last_frame - first_frame) % (frame_count - 1) == 0:
+            steps.add((last_frame - first_frame) // (frame_count - 1))
+        number = parts[-2]
+        for step in steps:
+            parts[-2] = str(int(number) + step).zfill(len(number))
+            if path.exists(path.join(folderpath, ".".join(parts))):
+                return True
+        return False
+
+    def record_output(self, folderpath, outpath, filetype, framerate, starting_frame, frames, reverse, mirror, width=None):
+        # width is only set for outputs scaled down by --outputs
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            (path.abspath(outpath), path.abspath(folderpath), filetype, framerate, starting_frame, frames,
+                             int(bool(reverse)), int(bool(mirror)), time.time(), width))
+            self.db.commit()
+
+    def find_output(self, folderpath, filetype, framerate, starting_frame, frames, reverse, mirror, width=None):
+        with self.lock:
+            rows = self.db.execute("SELECT outpath FROM outputs WHERE folder_path = ? AND filetype = ? AND framerate = ? AND "
+                                   "starting_frame = ? AND frames = ? AND reverse = ? AND mirror = ? AND width IS ?",
+                                   (path.abspath(folderpath), filetype, framerate, starting_frame, frames,
+                                    int(bool(reverse)), int(bool(mirror)), width)).fetchall()
+        for (outpath,) in rows:
+            if isfile(outpath):
+                return outpath
+        return None
+
+    def folder_status(self, folderpath, mtime_ns, filetype, framerate, reverse, mirror, width=None):
+        # "new" and "changed" folders need scanning, "not rendered" ones need an animation with these settings
+        row = self.folder(folderpath)
+        if row is None:
+            return "new", None
+        frame_count, first_frame, last_frame, catalog_mtime, last_file_mtime, last_file = row
+        if catalog_mtime != mtime_ns:
+            return "changed", None
+        if last_file and self.last_file_changed(folderpath, last_file, last_file_mtime, frame_count, first_frame, last_frame):
+            return "changed", None
+        outpath = self.find_output(folderpath, filetype, framerate, 1, frame_count, reverse, mirror, width)
+        if outpath is None:
+            return "not rendered", None
+        return "rendered", outpath
+
+    def frame_hashes(self, files):
+        # the cached hash of each frame with the modification time and size it was made from
+        with self.lock:
+            rows = self.db.execute("SELECT path, mtime_ns, size, hash FROM frame_hashes WHERE path IN (SELECT value FROM json_each(?))",
+                                   (json.dumps([path.abspath(f) for f in files]),)).fetchall()
+        return {filepath: (mtime_ns, size, hash) for filepath, mtime_ns, size, hash in rows}
+
+    def record_frame_hashes(self, rows):
+        with self.lock:
+            self.db.executemany("INSERT OR REPLACE INTO frame_hashes VALUES (?, ?, ?, ?)", rows)
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+def query_catalog(dir, filetype, framerate, reverse, mirror_list):
+    # lists the folders of dir that still need an animation with these settings, without reading any of their frames
+    catalogpath = path.join(getcwd(), "AnimatorOutput", "catalog.sqlite3")
+    if not path.exists(catalogpath):
+        print("No catalog found at %s, every folder needs animating." % catalogpath)
+        return
+
+    catalog = AnimatorCatalog(catalogpath)
+    archive = is_archive(dir)
+    index = ArchiveIndex(dir) if archive else FrameIndex(dir)
+    needs_render = []
+    for folder in index.folder_list():
+        status, outpath = catalog.folder_status(folder.path, folder.mtime_ns(), filetype, framerate, reverse, mirror_list)
+        if status == "rendered":
+            print("rendered      %s -> %s" % (folder.name, outpath))
+        else:
+            print("%-13s %s" % (status, folder.name))
+            needs_render.append(folder.name)
+    catalog.close()
+    if archive:
+        index.archive.close()
+
+    if len(index.files) > 0:
+        print("%d unsorted files in %s" % (len(index.files), dir))
+    print("\n%d of %d folders need animating." % (len(needs_render), len(index.folders)))
+    return needs_render
+
+class FrameCache:
+    # Decoded RGB frames of each folder kept in a memory-mapped .npy file, with the names, mtimes and sizes of the frames
+    # they were decoded from in a .json file beside it. Folders that were used least recently are removed once the cache
+    # is bigger than max_bytes. A folder too big for max_bytes only has the frames being animated cached, and when those don't
+    # fit either nothing is cached and the frames are streamed as they are.
+    def __init__(self, cachedir, max_bytes, prefetcher=None):
+        if np is None:
+            raise ImportError("numpy is needed for the frame cache")
+        self.prefetcher = prefetcher
+        if not path.exists(cachedir):
+            mkdir(cachedir)
+        self.cachedir = cachedir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.key_locks = {}
+        self.entries = {}
+        self.evict(keep=None)
+
+    def key(self, folderpath):
+        return hashlib.sha1(path.abspath(folderpath).encode("utf-8")).hexdigest()[:20]
+
+    def frame_stats(self, files):
+        stats = {}
+        for f in files:
+            st = frame_stat(f)
+            stats[path.basename(f)] = [st.st_mtime_ns, st.st_size]
+        return stats
+
+    def load(self, folderpath, files, build_files=None):
+        # returns the cached frames and the position of each file in them, building the cache from build_files if it's out of date
+        key = self.key(folderpath)
+        with self.lock:
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            entry = self.open_entry(key)
+            wanted = self.frame_stats(set(files))
+            if entry is None or any(entry[1].get(name) != stats for name, stats in wanted.items()):
+                if build_files is None:
+                    return None
+                # the size is worked out from the first frame before anything is decoded
+                size = self.frame_size(build_files[0])
+                if self.entry_bytes(build_files, size) > self.max_bytes:
+                    build_files = sorted(set(files))
+                    if self.entry_bytes(build_files, size) > self.max_bytes:
+                        print("%d decoded frames of %s are bigger than the frame cache, streaming them instead. (%d MB)" % (
+                            len(build_files), folderpath, self.entry_bytes(build_files, size) // 2**20))
+                        return None
+                entry = self.build(key, folderpath, build_files, size)
+
+            frames, stats, positions = entry
+            utime(path.join(self.cachedir, key + ".npy"))
+            return frames, [positions[path.basename(f)] for f in files]
+
+    def open_entry(self, key):
+        if key in self.entries:
+            return self.entries[key]
+        npypath = path.join(self.cachedir, key + ".npy")
+        metapath = path.join(self.cachedir, key + ".json")
+        if not path.exists(npypath) or not path.exists(metapath):
+            return None
+        with open(metapath, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        frames = np.load(npypath, mmap_mode="r")
+        names = meta["names"]
+        entry = (frames, {name: meta["frames"][name] for name in names}, {name: i for i, name in enumerate(names)})
+        self.entries[key] = entry
+        return entry
+
+    def frame_size(self, f):
+        with open_frame(f) as fh, Image.open(fh) as img:
+            return img.size
+
+    def entry_bytes(self, files, size):
+        # the frames and the .npy header in front of them
+        return len(files) * size[0] * size[1] * 3 + 128
+
+    def build(self, key, folderpath, files, size):
+        print("Caching %d decoded frames of %s" % (len(files), folderpath))
+        self.entries.pop(key, None)
+        stats = self.frame_stats(files)
+
+        # every frame is stored at the size of the first one
+        temppath = path.join(self.cachedir, key + ".tmp.npy")
+        frames = np.lib.format.open_memmap(temppath, mode="w+", dtype=np.uint8, shape=(len(files), size[1], size[0], 3))
+        sources = (io.BytesIO(data) for data in self.prefetcher.read(files)) if self.prefetcher else (open_frame(f) for f in files)
+        for i, source in enumerate(sources):
+            with source, Image.open(source) as img:
+                img = img.convert("RGB")
+            if img.size != size:
+                img = img.resize(size)
+            frames[i] = np.asarray(img)
+        frames.flush()
+        del frames
+
+        replace(temppath, path.join(self.cachedir, key + ".npy"))
+        with open(path.join(self.cachedir, key + ".json"), "w", encoding="utf-8") as f:
+            json.dump({"folder": path.abspath(folderpath), "names": [path.basename(f) for f in files], "frames": stats}, f)
+
+        self.evict(keep=key)
+        return self.open_entry(key)
+
+    def evict(self, keep):
+        with self.lock:
+            cached = []
+            for f in scandir(self.cachedir):
+                if f.name.endswith(".npy") and not f.name.endswith(".tmp.npy"):
+                    st = f.stat()
+                    cached.append((st.st_mtime, st.st_size, f.name[:-4]))
+
+            total = sum(size for _, size, _ in cached)
+            for _, size, key in sorted(cached):
+                if total <= self.max_bytes:
+                    break
+                if key == keep:
+                    continue
+                try:
+                    remove(path.join(self.cachedir, key + ".npy"))
+                    remove(path.join(self.cachedir, key + ".json"))
+                except OSError:
+                    continue
+                self.entries.pop(key, None)
+                total -= size
+
+            if total > self.max_bytes:
+                print("Frame cache is over its size limit with only the current folder in it. (%d MB)" % (total // 2**20))
+
+class FrameDeduper:
+    # Finds near-duplicate frames by a 64 bit difference hash of each one, the brightness gradient across a 9x8 thumbnail,
+    # so frames that look alike have hashes that differ in only a few bits. Hashes are kept in the catalog by the path,
+    # modification time and size of their frame, so each frame is only decoded once to hash it.
+    def __init__(self, catalog, workers=1):
+        if np is None:
+            raise ImportError("numpy is needed to find duplicate frames")
+        self.catalog = catalog
+        self.workers = workers
+
+    def thumbnail(self, filepath):
+        with open_frame(filepath) as fh, Image.open(fh) as img:
+            # JPEGs are decoded straight to a small grayscale image
+            img.draft("L", (64, 64))
+            return np.asarray(img.convert("L").resize((9, 8), Image.BILINEAR), dtype=np.int16)
+
+    def hashes(self, files):
+        stats = [frame_stat(f) for f in files]
+        cached = self.catalog.frame_hashes(files)
+        hashes = np.zeros(len(files), dtype=np.int64)
+        missing = []
+        for i, (f, st) in enumerate(zip(files, stats)):
+            row = cached.get(path.abspath(f))
+            if row and row[0] == st.st_mtime_ns and row[1] == st.st_size:
+                hashes[i] = row[2]
+            else:
+                missing.append(i)
+
+        if missing:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                thumbnails = np.stack(list(pool.map(self.thumbnail, [files[i] for i in missing])))
+            bits = (thumbnails[:, :, 1:] > thumbnails[:, :, :-1]).reshape(len(missing), 64)
+            hashes[missing] = np.packbits(bits, axis=1).view(">i8").ravel()
+            self.catalog.record_frame_hashes([(path.abspath(files[i]), stats[i].st_mtime_ns, stats[i].st_size, int(hashes[i])) for i in missing])
+
+        return hashes
+
+    def distances(self, a, b):
+        # amount of bits that differ between each pair of hashes
+        return np.unpackbits(np.bitwise_xor(a, b).view(np.uint8)).reshape(-1, 64).sum(axis=1)
+
+    def select(self, files, threshold=None, target_frames=None):
+        # positions of the frames to keep, in order. Runs of frames within threshold bits of the last kept frame are collapsed
+        # into it, then target_frames are spread evenly over how much the frames change, so slow stretches are thinned the most.
+        hashes = self.hashes(files)
+        keep = np.arange(len(files))
+
+        if threshold is not None and len(files) > 2:
+            unsigned = [int(h) & 0xFFFFFFFFFFFFFFFF for h in hashes]
+            kept = [0]
+            for i in range(1, len(files) - 1):
+                if bin(unsigned[i] ^ unsigned[kept[-1]]).count("1") > threshold:
+                    kept.append(i)
+            # the last frame is always kept so the animation still ends where training did
+            kept.append(len(files) - 1)
+            keep = np.array(kept)
+
+        if target_frames and len(keep) > target_frames:
+            change = self.distances(hashes[keep][1:], hashes[keep][:-1])
+            # every frame counts for at least one bit of change, so still stretches are thinned instead of dropped
+            progress = np.concatenate(([0], np.cumsum(change + 1)))
+            picked = np.unique(np.searchsorted(progress, np.linspace(0, progress[-1], target_frames)))
+            if len(picked) < target_frames:
+                # big jumps can land several marks on one frame, the rest go to the frames that changed the most
+                rest = np.setdiff1d(np.arange(len(keep)), picked)
+                most_changed = rest[np.argsort(-change[rest - 1], kind="stable")]
+                picked = np.sort(np.concatenate((picked, most_changed[:target_frames - len(picked)])))
+            keep = keep[picked]
+
+        return [int(i) for i in keep]
+
+class StageMetrics:
+    # Times each stage of each folder and hands the results, along with FFMPEG's progress, to a JSON lines file and/or a callback.
+    # The stage named by profile_stage is also run under cProfile, with its stats saved in profile_dir.
+    stages = ['scan', 'sort', 'select', 'dedup', 'overlay', 'encode']
+
+    def __init__(self, metrics_path=None, callback=None, profile_stage=None, profile_dir=None, show_progress=False):
+        self.metrics_path = metrics_path
+        self.callback = callback
+        self.profile_stage = profile_stage
+        self.profile_dir = profile_dir
+        self.show_progress = show_progress
+        self.lock = threading.Lock()
+        self.current = threading.local()
+        self.profile_count = 0
+        self.failed = False
+
+    def enabled(self):
+        return bool(self.metrics_path or self.callback or self.show_progress)
+
+    def emit(self, record):
+        # a metrics file that can't be written or a callback that raises never fails the stage being timed,
+        # the first error is shown and the rest of the records are still handed out
+        if not (self.metrics_path or self.callback):
+            return
+        record["time"] = time.time()
+        with self.lock:
+            try:
+                if self.metrics_path:
+                    with open(self.metrics_path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(record) + "\n")
+                if self.callback:
+                    self.callback(record)
+            except Exception as e:
+                if not self.failed:
+                    print("Failed to report metrics: %s" % e, file=sys.stderr)
+                    self.failed = True
+
+    @contextmanager
+    def collect(self, timings):
+        # the stages run on this thread, and the encodes it queues, also add their seconds to the timings dict
+        previous = getattr(self.current, "timings", None)
+        self.current.timings = timings
+        try:
+            yield timings
+        finally:
+            self.current.timings = previous
+
+    @contextmanager
+    def stage(self, folder, stage, frames=None, outpath=None):
+        previous = (getattr(self.current, "folder", None), getattr(self.current, "stage", None))
+        timings = getattr(self.current, "timings", None)
+        self.current.folder, self.current.stage = folder, stage
+
+        profiler = None
+        if stage == self.profile_stage:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # only one profiler can run at a time, this run of the stage isn't profiled
+                profiler = None
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.current.folder, self.current.stage = previous
+            if timings is not None:
+                with self.lock:
+                    timings[stage] = timings.get(stage, 0) + seconds
+
+            record = {"event": "stage", "folder": folder, "stage": stage, "seconds": seconds}
+            if frames is not None:
+                record["frames"] = frames
+                record["fps"] = frames / seconds if seconds else None
+            if outpath:
+                outpaths = [outpath] if isinstance(outpath, str) else outpath
+                record["bytes"] = sum(path.getsize(p) for p in outpaths if isfile(p))
+
+            if profiler:
+                profiler.disable()
+                record["profile"] = self.save_profile(profiler, folder, stage)
+
+            self.emit(record)
+
+    def timed(self, folder, stage, func, frames=None, outpath=None):
+        # wraps func so it runs as a stage wherever it's called, including worker threads
+        timings = getattr(self.current, "timings", None)
+        def run(*args):
+            with self.collect(timings), self.stage(folder, stage, frames, outpath):
+                return func(*args)
+        return run
+
+    def save_profile(self, profiler, folder, stage):
+        if not path.exists(self.profile_dir):
+            mkdir(self.profile_dir)
+        with self.lock:
+            self.profile_count += 1
+            profilepath = path.join(self.profile_dir, "%s_%s_%d.prof" % (stage, path.basename(path.normpath(str(folder))), self.profile_count))
+        profiler.dump_stats(profilepath)
+        print("Saved %s profile of %s to %s" % (stage, folder, profilepath))
+        return profilepath
+
+    def read_progress(self, stdout, folder, stage):
+        # FFMPEG's -progress output is blocks of key=value lines, each block ends with a progress= line.
+        # stdout is read to the end, FFMPEG would stop once the pipe is full otherwise
+        progress = {}
+        for line in stdout:
+            key, _, value = line.decode("utf-8", "replace").strip().partition("=")
+            if not key:
+                continue
+            progress[key] = value
+            if key != "progress":
+                continue
+
+            self.emit({"event": "progress", "folder": folder, "stage": stage, "frame": progress.get("frame"), "fps": progress.get("fps"),
+                       "out_time": progress.get("out_time"), "total_size": progress.get("total_size"),
+                       "speed": progress.get("speed"), "progress": value})
+            if self.show_progress:
+                end = "\n" if value == "end" else ""
+                print("\r%s: frame %s, %s fps, %s" % (folder, progress.get("frame"), progress.get("fps"), progress.get("speed")),
+                      end=end, file=sys.stderr, flush=True)
+            progress = {}
+
+class AnimationJob:
+    # One animation for Animator to make. folder is a sorted frame folder, either its name in the Animator's directory or its path.
+    # starting_frame and frames work like --starting_frame and --frames, leaving both out uses every frame.
+    def __init__(self, folder, framerate=14, filetype="mp4", starting_frame=None, frames=None, reverse=False, mirror=False,
+                 info=False, render_frame_text=False, overwrite="new", dedup=None, target_frames=None):
+        self.folder = folder
+        self.framerate = framerate
+        self.filetype = filetype
+        self.starting_frame = starting_frame
+        self.frames = frames
+        self.reverse = reverse
+        self.mirror = mirror
+        self.info = info
+        self.render_frame_text = render_frame_text
+        self.overwrite = overwrite
+        self.dedup = dedup
+        self.target_frames = target_frames
+
+class AnimationResult:
+    # What came of one animation: where it was saved, the frames it used and the seconds spent in each stage.
+    # status is "encoding" until wait() returns, then "completed" or "failed". Animations that weren't made are "skipped" or "failed" straight away.
+    def __init__(self, name, status="encoding", outpath=None, starting_frame=None, frames=None, error=None):
+        self.job = None
+        self.name = name
+        self.status = status
+        self.outpath = outpath
+        self.text_outpath = None
+        self.starting_frame = starting_frame
+        self.frames = frames
+        self.error = error
+        # every file made, when --outputs makes more than one
+        self.outpaths = [outpath] if outpath else []
+        self.timings = {}
+        # FFMPEG return codes, or futures of them when the encodes were queued
+        self.encodes = []
+
+    def wait(self):
+        for encode in self.encodes:
+            try:
+                returncode = encode.result() if hasattr(encode, "add_done_callback") else encode
+                if returncode != 0:
+                    raise RuntimeError("FFMPEG exited with code %d" % returncode)
+            except Exception as e:
+                self.error = self.error or e
+        self.encodes = []
+
+        if self.status == "encoding":
+            self.status = "failed" if self.error else "completed"
+        return self
+
+    def __repr__(self):
+        return "AnimationResult(%r, %r, %r)" % (self.name, self.status, self.outpath)
 
+class MLAnimator:
+    def __init__(self, dir, framerate, starting_frame, frames, filetype, animate, reverse, mirror_list, info, all, Render_Frame_Text=False, jobs=1, encoder="pipe", text_fields=("frame",), save_text_frames=False,
+                 watch=False, preview_frames=50, debounce=2.0, preview_interval=10.0, poll=False, incremental=False, skip_unchanged=False, chunks=1, ranges=None,
+                 frame_cache=False, cache_size=4096, dry_run=False,
+                 metrics=None, metrics_callback=None, profile_stage=None, show_progress=False, overwrite=None, dedup=None, target_frames=None,
+                 prefetch=0, prefetch_window=32, outputs=None, tile_width=160, sheet_columns=10, sheet_rows=10, sheet_step=1):
         if framerate < 1:
             print("Invalid framerate.")
             return
 
-        # Get all directories to check if they are sorted image folders
-        dirs = [f for f in scandir(dir) if f.is_dir() and f.name != "Unsorted_Files"]
+        if overwrite is None:
+            overwrite = "new" if all else "prompt"
 
-        # get list of files in the selected directory if they are a compatible file type
-        files = self.confirm_files(dir)
+        try:
+            self.configure(jobs, encoder, text_fields, save_text_frames, incremental, filetype, chunks, ranges, overwrite,
+                           metrics, metrics_callback, profile_stage, show_progress, dedup, target_frames, prefetch, prefetch_window, outputs,
+                           tile_width, sheet_columns, sheet_rows, sheet_step)
+        except ValueError as e:
+            print(e)
+            return
 
-        if not path.exists(animator_output_path):
-            print("Creating main output folder at " + str(animator_output_path))
-            mkdir(animator_output_path)
+        # the first of the outputs takes the place of --filetype
+        if self.outputs:
+            filetype = self.outputs[0][0]
 
-        self.animator_output_path = animator_output_path
+        # archives are read in place and sorted virtually by the prefix of each frame
+        archive = is_archive(dir)
+        if archive:
+            if watch:
+                print("Archives can't be watched.")
+                return
+            if self.encoder == "concat":
+                print("Frames in archives are streamed to FFMPEG, using the pipe encoder.")
+                self.encoder = "pipe"
+
+        # a dry run never writes anything, not even the output folder
+        if not dry_run:
+            try:
+                self.open_output(frame_cache, cache_size)
+            except ImportError as e:
+                print("Missing dependency: %s" % e)
+                return
 
         if not all:
             if starting_frame:
@@ -52,96 +1173,347 @@ class MLAnimator:
                     return
                 frames = int(frames)
 
-        sorted_folder = True
+        # the watcher starts before anything is sorted, so frames the trainer writes during the first sort aren't missed
+        watcher = None
+        if watch and not dry_run:
+            watcher = DirectoryWatcher(dir, use_inotify=not poll)
+
+        if not dry_run and not archive:
+            SortPlan.resume(dir)
+
+        # Scan the directory once for its sorted image folders and compatible files, every later step reads from this index
+        with self.metrics.stage(dir, "scan"):
+            index = ArchiveIndex(dir) if archive else FrameIndex(dir)
+        self.index = index
+        if archive and index.misc_count:
+            print("Leaving out %d misc images in %s" % (index.misc_count, dir))
+        dirs = index.folder_list()
+        files = index.files
 
-        # if there are files, then check to see if this is a sorted frame folder
+        # if there are files, then check to see if this is a sorted frame folder, and plan where every other file goes
         if len(files) > 0:
-            # if there are no directories, check to see if the pictures are in numbered order
-            if len(dirs) == 0:
-                lastname = None
-                for f in files:
-                    checkedname = self.get_filename(f)
-                    if checkedname:
-                        if lastname and checkedname != lastname:
-                            sorted_folder = False
-                            break
+            plan = SortPlan(index)
+            sorted_folder = plan.sorted_folder
 
-                        lastname = checkedname
+            # a new training output folder only has one prompt in it, but it still needs sorting when watched
+            if watch:
+                sorted_folder = False
 
-                    if not checkedname:
-                        sorted_folder = False
-                        break
+            # a dry run only shows what sorting would do, so nothing is animated either
+            if sorted_folder and dry_run:
+                print("%s is already a sorted folder, nothing to sort." % dir)
+                return
 
-            else: sorted_folder = False
             # If this is the sorted folder, do not sort again. Produces an animation file in its base directory's output folder
             if sorted_folder:
                 if animate:
                     diroutname = path.basename(path.dirname(
                         path.dirname(dir))) + "_" + filetype + "_output"
-                    self.create_animation_file(dirs, dir, self.get_filename(files[0]), framerate, frames, filetype, starting_frame, mirror_list, reverse, diroutname, info, all,Render_Frame_Text)
-                    print("Animation file completed.")
+                    prefix = index.prefix(files[0])
+                    result = self.create_animation_file(dirs, dir, prefix, framerate, frames, filetype, starting_frame, mirror_list, reverse, diroutname, info, all,Render_Frame_Text, folder=index.root_folder(prefix))
+                    self.report_animation(prefix, result)
                     return
             if not sorted_folder:
-                for f in files:
-                    # if filename is valid
-                    filename = self.get_filename(f)
-                    if filename:
-                        self.sort_unsorted_image(dir, f, filename)
-                    # if get_filename returns None, the file will be sorted with the other misc images
-                    else:
-                        print(f"Sorting misc image {f}")
-                        self.move_misc_image(dir, f)
+                if dry_run:
+                    plan.print_plan()
+                    return
+                with self.metrics.stage(dir, "sort", frames=len(plan.moves)):
+                    plan.apply()
+
+        if dry_run:
+            print("Nothing to sort in %s" % dir)
+            return
+
+        if watcher:
+            self.watch_directory(dir, watcher, framerate, filetype, animate, preview_frames, debounce, preview_interval)
+            return
 
         if not animate:
             print("Files are in sorted folders.")
             return
 
         # Produces a folder of animation files in the main output directory.
-        dirs = [f for f in scandir(dir) if f.is_dir() and f.name != "Unsorted_Files"]
+        dirs = index.folder_list()
         if len(dirs) > 0:
             basename = path.basename(dir)
             if basename == "":
                 dir = path.basename(getcwd())
-            diroutname = path.basename(dir) + "_" + filetype + "_output"
+            diroutname = (archive_name(dir) if archive else path.basename(dir)) + "_" + filetype + "_output"
+
+            # frame selection stays in order on this thread, only the FFMPEG encodes are run in the pool
+            if jobs > 1:
+                self.executor = ThreadPoolExecutor(max_workers=jobs)
+
             for d in dirs:
-                files = [f.name for f in scandir(d) if isfile(
-                    join(d, f.name)) and f.name.split(".")[-1] in image_file_types]
+                mtime = d.mtime_ns()
+                if skip_unchanged and all:
+                    # with --outputs a folder is only skipped when every file type and size of it is rendered
+                    rendered = []
+                    for output_type, width in self.outputs or [(filetype, None)]:
+                        status, outpath = self.catalog.folder_status(d.path, mtime, output_type, framerate, reverse, mirror_list, width)
+                        if status != "rendered":
+                            break
+                        rendered.append(outpath)
+                    else:
+                        print("Skipping unchanged folder %s (%s)" % (d.name, ", ".join(rendered)))
+                        continue
+
                 # Creates animation file if directory's contents are numbered frames.
-                if len(files) > 2:
-                    self.create_animation_file(dirs, d.path, d.name, framerate, frames, filetype,
-                                          starting_frame, mirror_list, reverse, diroutname, info, all, Render_Frame_Text)
-                    print("Animation file completed.")
+                if d.load().image_count > 2:
+                    self.catalog.record_folder(d, mtime)
+                    if not self.executor:
+                        result = self.create_animation_file(dirs, d.path, d.name, framerate, frames, filetype,
+                                              starting_frame, mirror_list, reverse, diroutname, info, all, Render_Frame_Text, folder=d)
+                        self.report_animation(d.name, result)
+                        continue
+
+                    try:
+                        result = self.create_animation_file(dirs, d.path, d.name, framerate, frames, filetype,
+                                              starting_frame, mirror_list, reverse, diroutname, info, all, Render_Frame_Text, folder=d)
+                    except Exception as e:
+                        print("Failed to queue animation of %s: %s" % (d.name, e))
+                        self.encode_jobs.append((d.name, None, e))
+                        continue
+                    # animations that failed before anything was queued, such as an invalid frame selection, are in the summary too
+                    if isinstance(result, AnimationResult) and result.status == "failed":
+                        self.encode_jobs.append((d.name, result.outpath, result.error))
+                    continue
+
+                print("No appropriate file list in %s" % (d.path))
+
+            if self.executor:
+                self.wait_for_encodes()
+
+    def configure(self, jobs=1, encoder="pipe", text_fields=("frame",), save_text_frames=False, incremental=False, filetype="mp4", chunks=1,
+                  ranges=None, overwrite="new", metrics=None, metrics_callback=None, profile_stage=None, show_progress=False,
+                  dedup=None, target_frames=None, prefetch=0, prefetch_window=32, outputs=None,
+                  tile_width=160, sheet_columns=10, sheet_rows=10, sheet_step=1):
+        # checks the settings shared by every animation of a run, raises ValueError for the first invalid one
+        if jobs < 1:
+            raise ValueError("Invalid job amount.")
+
+        if encoder not in encoder_types:
+            raise ValueError("Invalid encoder: %s" % encoder)
+
+        self.encoder = encoder
+
+        if prefetch < 0 or prefetch_window < 1:
+            raise ValueError("Invalid prefetch setting.")
+
+        self.prefetcher = None
+        if prefetch:
+            self.prefetcher = FramePrefetcher(prefetch, prefetch_window)
+            if encoder == "concat":
+                # FFMPEG opens each frame itself with the concat encoder, so prefetched frames have to be piped to it
+                print("Prefetched frames are streamed to FFMPEG, using the pipe encoder.")
+                self.encoder = "pipe"
+
+        for field in text_fields:
+            if field not in text_field_types:
+                raise ValueError("Invalid frame text field: %s" % field)
+
+        self.text_fields = text_fields
+        self.save_text_frames = save_text_frames
+        self.text_workers = cpu_count() or 1
+        self.font_cache = threading.local()
+
+        if incremental and filetype not in segment_file_types:
+            raise ValueError("Incremental encoding needs one of these file types: %s" % ", ".join(segment_file_types))
+
+        self.incremental = incremental
+
+        if chunks < 0:
+            raise ValueError("Invalid chunk amount.")
+
+        self.chunks = chunks or cpu_count() or 1
+
+        self.ranges = None
+        if ranges:
+            try:
+                self.ranges = self.parse_ranges(ranges)
+            except ValueError as e:
+                raise ValueError("Invalid range selection: %s" % e)
+
+        self.outputs = None
+        if outputs:
+            try:
+                self.outputs = self.parse_outputs(outputs)
+            except ValueError as e:
+                raise ValueError("Invalid outputs: %s" % e)
+            if self.ranges or incremental:
+                raise ValueError("--outputs can't be used with --ranges or --incremental")
+            if any(output_type in sheet_file_types for output_type, _ in self.outputs):
+                raise ValueError("Sheets and atlases can't be made with --outputs")
+
+        if filetype in sheet_file_types:
+            if np is None:
+                raise ValueError("numpy is needed for sheets and atlases")
+            if self.ranges:
+                raise ValueError("Sheets and atlases can't be made with --ranges")
+        if tile_width < 1 or sheet_columns < 1 or sheet_rows < 1 or sheet_step < 1:
+            raise ValueError("Invalid sheet setting.")
+
+        self.tile_width = tile_width
+        self.sheet_columns = sheet_columns
+        self.sheet_rows = sheet_rows
+        self.sheet_step = sheet_step
+
+        if overwrite not in overwrite_policies:
+            raise ValueError("Invalid overwrite policy: %s" % overwrite)
+
+        self.deduper = None
+        self.set_dedup(dedup, target_frames)
+
+        # only "prompt" asks before making another copy of an animation, or for frame settings that weren't given
+        self.overwrite = overwrite
+        self.interactive = overwrite == "prompt"
+
+        # output paths handed out during this run, so queued encodes never share a filename
+        self.names = NameAllocator()
+        self.encode_jobs = []
+        self.failed = []
+        self.executor = None
+
+        if profile_stage and profile_stage not in StageMetrics.stages:
+            raise ValueError("Invalid stage to profile: %s" % profile_stage)
+
+        self.animator_output_path = path.join(getcwd(), "AnimatorOutput")
+        self.metrics = StageMetrics(metrics, metrics_callback, profile_stage, path.join(self.animator_output_path, "profiles"), show_progress)
+
+    def open_output(self, frame_cache=False, cache_size=4096):
+        # makes the main output folder with its catalog, and the frame cache when it's turned on
+        if not path.exists(self.animator_output_path):
+            print("Creating main output folder at " + str(self.animator_output_path))
+            mkdir(self.animator_output_path)
+
+        self.catalog = AnimatorCatalog(path.join(self.animator_output_path, "catalog.sqlite3"))
+
+        self.frame_cache = None
+        if frame_cache:
+            self.frame_cache = FrameCache(path.join(self.animator_output_path, ".frame_cache"), cache_size * 2**20, self.prefetcher)
+
+        if self.dedup is not None or self.target_frames:
+            self.deduper = FrameDeduper(self.catalog, self.text_workers)
+
+    def set_dedup(self, dedup=None, target_frames=None):
+        # dedup is how many of the 64 bits of a frame's hash may differ from the last kept frame for it to be dropped
+        if dedup is not None and not 0 <= dedup < 64:
+            raise ValueError("Invalid dedup threshold: %s (must be from 0 to 63)" % dedup)
+        if target_frames is not None and target_frames < 2:
+            raise ValueError("Invalid target frame amount: %s" % target_frames)
+        self.dedup = dedup
+        self.target_frames = target_frames
+
+    def watch_directory(self, dir, watcher, framerate, filetype, animate, preview_frames, debounce, preview_interval):
+        # Sorts files as the trainer writes them and keeps a preview of the latest frames of each prompt.
+        # Previews are made after a prompt has had no new frames for `debounce` seconds, at most once every `preview_interval` seconds,
+        # and only one preview is encoded at a time so a slow encode only makes the next preview cover more new frames.
+        # the watcher was started before the first scan, so frames written while it was sorting are reported here too
+        index = self.index
+        previewoutpath = self.set_sorted_folder(path.basename(path.normpath(path.abspath(dir))) + "_" + filetype + "_preview", filetype)
+        preview_executor = ThreadPoolExecutor(max_workers=1)
+        preview_job = None
+
+        # previews are made for every folder that's already sorted
+        last_change = {folder.name: 0 for folder in index.folder_list()}
+        last_preview = {}
+
+        print("Watching %s for new frames. (Press Ctrl+C to stop)" % dir)
+        try:
+            while True:
+                for f in watcher.wait(min(debounce, 1.0)):
+                    if not isfile(path.join(dir, f)):
+                        continue
+                    sortedname = index.add_file(f)
+                    if sortedname is None and f not in index.parsed:
+                        continue
+                    # like the first sort, images without a prompt name are misc images and a file isn't moved over one with the same name
+                    sortedname = sortedname or "Unsorted_Files"
+                    if path.exists(path.join(dir, sortedname, f)):
+                        continue
+                    if sortedname == "Unsorted_Files":
+                        print(f"Sorting misc image {f}")
+                        self.move_misc_image(dir, f)
+                    else:
+                        self.sort_unsorted_image(dir, f, sortedname)
+                        index.add_sorted_file(f, sortedname)
+                        last_change[sortedname] = time.monotonic()
+
+                if not animate or (preview_job and not preview_job.done()):
                     continue
 
-                print("No appropriate file list in %s" % (d))
+                now = time.monotonic()
+                for name, changed in last_change.items():
+                    if now - changed < debounce or now - last_preview.get(name, -preview_interval) < preview_interval:
+                        continue
+
+                    del last_change[name]
+                    last_preview[name] = now
+                    files = index.folders[name].files()[-preview_frames:]
+                    if len(files) > 1:
+                        preview_job = preview_executor.submit(self.encode_preview, files, previewoutpath, name, filetype, framerate)
+                    break
+
+        except KeyboardInterrupt:
+            print("\nStopped watching %s" % dir)
+
+        finally:
+            watcher.close()
+            preview_executor.shutdown()
+
+    def encode_preview(self, files, previewoutpath, name, filetype, framerate):
+        # the preview is encoded to a temporary file and swapped in, so it's never seen half written
+        outpath = path.join(previewoutpath, "%s_preview.%s" % (name, filetype))
+        temppath = path.join(previewoutpath, "%s_preview.tmp.%s" % (name, filetype))
+        # previews only use the frame cache when the frames are already in it, new frames would mean decoding the folder again
+        if self.encode_file_list(files, temppath, framerate, build=False) == 0:
+            replace(temppath, outpath)
+            print("Updated preview of %s (%d frames)" % (name, len(files)))
+        else:
+            print("Failed to update preview of %s" % name)
 
-    def create_animation_file(self, dirs, dirpath, dirname, framerate, frames, filetype, starting_frame, mirror_list, reverse, diroutname, info, all, Render_Frame_Text):
+    def create_animation_file(self, dirs, dirpath, dirname, framerate, frames, filetype, starting_frame, mirror_list, reverse, diroutname, info, all, Render_Frame_Text, folder=None):
 
         diroutpath = self.set_sorted_folder(diroutname, filetype)
-        files = []
-
-        for f in scandir(dirpath):
-            if isfile(f.path):
-                checkedname = self.get_filename(f.name)
-                if checkedname != None and checkedname == dirname and f.name.split('.')[-1] in image_file_types:
-                    files.append(path.join(dirpath, f.name))
 
-        files = sorted(files, key=lambda f: self.get_file_num(f, len(files)))
+        # frames are read from the index when it's given, otherwise the folder is scanned here
+        if folder is None:
+            folder = FrameFolder(dirpath, dirname)
+
+        if self.incremental:
+            if starting_frame or frames or reverse or mirror_list or info or Render_Frame_Text:
+                print("Incremental encoding always uses every frame in order, frame selection options are ignored.")
+            return self.create_incremental_animation(folder, diroutpath, framerate, filetype)
+
+        if self.ranges:
+            ignored = [flag for flag, used in (("--starting_frame", starting_frame), ("--frames", frames), ("--info", info),
+                                               ("--rendertext", Render_Frame_Text), ("--dedup", self.dedup is not None),
+                                               ("--target_frames", self.target_frames)) if used]
+            if ignored:
+                print("Frame ranges are set with --ranges, %s %s ignored." % (", ".join(ignored), "is" if len(ignored) == 1 else "are"))
+            return self.create_range_animations(folder, diroutpath, framerate, filetype, reverse, mirror_list,
+                                                ask=self.overwrite == "prompt" and not all)
+
+        with self.metrics.stage(dirname, "select"):
+            files = folder.files()
         if len(files) > 0:
-            framefiletype = path.splitext(files[0])[1]
-
-        # this is to fix file paths that include Windows styled paths and apostrophes
-        files = [self.escape_str(f) for f in files]
+            framefiletype = "." + folder.ext
 
         filename = no_info_filename = dirname
-        file_entry = "%s.%s" % (filename, filetype)
+        # sheets and atlases are named by their JSON index, their pages are saved beside it
+        outext = "json" if filetype in sheet_file_types else filetype
+        file_entry = "%s.%s" % (filename, outext)
         frames_ready = False
         outpath = path.join(diroutpath, file_entry)
 
         # ask to overwrite before new frames are set
-        if not all and not self.confirm_file_changes(outpath):
+        if self.overwrite == "prompt" and not all and not self.confirm_file_changes(outpath):
             print("Didn't confirm: %s" % outpath)
-            return
+            return AnimationResult(dirname, "skipped")
+
+        if self.overwrite == "skip" and not info and not self.outputs and (isfile(outpath) or self.names.is_claimed(outpath)):
+            print("Skipping existing animation: %s" % outpath)
+            return AnimationResult(dirname, "skipped", outpath)
 
         # sets to max
         if all:
@@ -149,10 +1521,14 @@ class MLAnimator:
             self.set_info(dirname, starting_frame=1, length=size, frames=size)
             frames_ready = True
 
-        # using default settings lets user select frames
+        # using default settings lets user select frames, or uses all of them when nobody can be asked
         elif not frames and not starting_frame:
-            self.set_info(dirname, length=len(files))
-            frames_ready = self.set_frame_amt()
+            if self.interactive:
+                self.set_info(dirname, length=len(files))
+                frames_ready = self.set_frame_amt()
+            else:
+                self.set_info(dirname, starting_frame=1, length=len(files), frames=len(files))
+                frames_ready = True
 
         # non default sets any uninitialized setting to its max amount
         else:
@@ -170,7 +1546,7 @@ class MLAnimator:
             frames_ready = self.check_valid_frames()
 
             # if frames didn't validate, ask to manually set
-            if not frames_ready:
+            if not frames_ready and self.interactive:
                 select = input("Set new frame values for %s? (y/n) : " % dirname)
                 if select.strip().lower() in ("y", "yes", ""):
                     frames_ready = self.set_frame_amt()
@@ -178,7 +1554,9 @@ class MLAnimator:
         # return if user canceled out of setting frames loop
         if not frames_ready:
             print("Skipping animation of %s." % (self.name))
-            return
+            if self.interactive:
+                return AnimationResult(dirname, "skipped")
+            return AnimationResult(dirname, "failed", error=ValueError("Invalid frame selection for %s (%d frames)" % (dirname, len(files))))
 
         # attach frame settings to filename if --info is set
         if info:
@@ -187,105 +1565,783 @@ class MLAnimator:
             # outpath = path.join(diroutpath, filename + "." + filetype)
 
             # ask to overwrite before creating duplicate animation
-            if not all and not self.confirm_file_changes(outpath):
+            if self.overwrite == "prompt" and not all and not self.confirm_file_changes(outpath):
                 print("Skipping animation: %s" % self.name)
-                return
+                return AnimationResult(dirname, "skipped")
+
+        outputs = []
+        if self.outputs:
+            outputs = self.outputs_paths(diroutname, filetype, filename)
+            if not outputs:
+                print("Skipping existing animations of %s" % dirname)
+                return AnimationResult(dirname, "skipped")
+            outpath = outputs[0][0]
+        else:
+            outpath = self.output_path(diroutpath, filename, outext)
+            if outpath is None:
+                print("Skipping existing animation: %s" % path.join(diroutpath, "%s.%s" % (filename, outext)))
+                return AnimationResult(dirname, "skipped", path.join(diroutpath, "%s.%s" % (filename, outext)))
 
-        outpath = self.set_valid_filename(diroutpath, filename, filetype, 0)
+        # the output names are given back when anything fails before their encodes are started
+        reserved = [output[0] for output in outputs] or [outpath]
+        try:
+            starting_frame = self.starting_frame - 1
+            end_frame = self.frames + starting_frame
+            print(f"end_frame: {end_frame}")
+            file_list = files[starting_frame:end_frame]
+            # position of each selected frame in the folder, counted the same way as --starting_frame
+            source_indexes = list(range(starting_frame + 1, end_frame + 1))
+
+            # near-duplicate frames are dropped before the frame order is set, so reverse and mirror play the same frames
+            if self.dedup is not None or self.target_frames:
+                if self.deduper is None:
+                    self.deduper = FrameDeduper(self.catalog, self.text_workers)
+                with self.metrics.stage(dirname, "dedup", frames=len(file_list)):
+                    keep = self.deduper.select(file_list, self.dedup, self.target_frames)
+                print("Kept %d of %d frames of %s" % (len(keep), len(file_list), dirname))
+                file_list = [file_list[i] for i in keep]
+                source_indexes = [source_indexes[i] for i in keep]
+
+            if filetype in sheet_file_types and self.sheet_step > 1:
+                file_list = file_list[::self.sheet_step]
+                source_indexes = source_indexes[::self.sheet_step]
+
+            if reverse:
+                file_list = [ele for ele in reversed(file_list)]
+                source_indexes.reverse()
+
+            # create animation file for the frames collected from dirpath
+            if outputs:
+                result = self.run_FFMPEG_outputs(file_list, outputs, end_frame, framerate, mirror_list, reverse, folder=folder)
+            elif filetype in sheet_file_types:
+                if mirror_list or Render_Frame_Text:
+                    print("Sheets show each frame once, --mirror and --rendertext are ignored.")
+                    Render_Frame_Text = False
+                # tiles are labelled with the frame numbers in the file names, such as the iteration a frame was saved at
+                numbers = folder.frame_numbers()
+                frame_numbers = [numbers[i - 1] for i in source_indexes]
+                result = self.run_sheet(dirname, file_list, source_indexes, frame_numbers, outpath, filetype, framerate, folder=folder)
+                self.catalog_output(result, dirpath, outpath, filetype, framerate, reverse, mirror_list)
+            else:
+                result = self.run_FFMPEG(file_list, dirpath, end_frame, outpath, framerate, mirror_list, folder=folder)
+                self.catalog_output(result, dirpath, outpath, filetype, framerate, reverse, mirror_list)
+            animation = AnimationResult(dirname, "encoding", outpath, self.starting_frame, self.frames)
+            animation.outpaths = reserved
+            animation.encodes.append(result)
+            self.settle_outputs(result, animation.outpaths)
+
+            if Render_Frame_Text:
+                new_dir_name = no_info_filename + "_frameTextRendered"
+                frameTextRender_dir = join(self.animator_output_path, new_dir_name)
+                if not path.exists(frameTextRender_dir):
+                    mkdir(frameTextRender_dir)
+
+                # the drawn frames are streamed to FFMPEG, they are only saved as images when asked for
+                framesWithTextDir = None
+                if self.save_text_frames:
+                    framesWithTextDir = self.set_valid_dirname(None, frameTextRender_dir, new_dir_name)
+                    print("framesWithTextDir: " + framesWithTextDir)
+
+                text_entries = [(img_file, i, source_indexes[i], True) for i, img_file in enumerate(file_list)]
+                if mirror_list:
+                    # mirrored frames keep their labels and are not saved twice
+                    text_entries += [(img_file, i, source_index, False) for img_file, i, source_index, _ in text_entries[-2:0:-1]]
+
+                new_frame_rendered_filename = f"fr_{filename}"
+                newoutpath = self.output_path(frameTextRender_dir, new_frame_rendered_filename, filetype)
+                if newoutpath:
+                    reserved = reserved + [newoutpath]
+                    animation.text_outpath = newoutpath
+                    text_result = self.run_FFMPEG_text(text_entries, framesWithTextDir, end_frame, newoutpath, framerate, folder=folder)
+                    animation.encodes.append(text_result)
+                    self.settle_outputs(text_result, [newoutpath])
+        except Exception:
+            for reservedpath in reserved:
+                self.names.settle(reservedpath, False)
+            raise
+
+        return animation
+
+    def run_FFMPEG_text(self, text_entries, save_dir, end_frame, outpath, framerate, folder=None):
+        print("Animating frame text: %s\nStarting frame: %d\nEnd Frame: %d\nFile List Length: %d\nSaving file to: %s" % (
+            self.name, self.starting_frame, end_frame, self.frames, outpath))
+
+        encode = self.metrics.timed(self.name, "overlay", self.encode_text_frames, len(text_entries), outpath)
+        encode_args = (text_entries, save_dir, outpath, framerate, folder)
+        if self.executor:
+            future = self.executor.submit(encode, *encode_args)
+            self.encode_jobs.append((self.name, outpath, future))
+            return future
+
+        return encode(*encode_args)
 
-        starting_frame = self.starting_frame - 1
-        end_frame = self.frames + starting_frame
-        print(f"end_frame: {end_frame}")
-        file_list = files[starting_frame:end_frame]
+    def encode_text_frames(self, text_entries, save_dir, outpath, framerate, folder=None):
+        cached = {}
+        if self.frame_cache:
+            cached = self.cached_frames([entry[0] for entry in text_entries], folder)
+
+        # every frame is drawn at the size of the first one so they can be streamed as raw pixels
+        if cached:
+            first = cached[text_entries[0][0]]
+            size = (first.shape[1], first.shape[0])
+        else:
+            with open_frame(text_entries[0][0]) as fh, Image.open(fh) as img:
+                size = img.size
+
+        return self.encode_frames(self.render_frame_text(text_entries, size, save_dir, cached), outpath, framerate, self.raw_input_args(size))
+
+    def render_frame_text(self, text_entries, size, save_dir=None, cached=None):
+        # frames are drawn on a pool of threads, only a couple of frames per thread are held in memory at once
+        window = deque()
+        # frames that aren't in the frame cache are read ahead by the prefetcher when it's on
+        sources = [None] * len(text_entries)
+        if self.prefetcher and not cached:
+            sources = self.prefetcher.read([entry[0] for entry in text_entries])
+
+        with ThreadPoolExecutor(max_workers=self.text_workers) as pool:
+            for entry, data in zip(text_entries, sources):
+                window.append(pool.submit(self.draw_frame_text, entry, size, save_dir, cached, data))
+                if len(window) >= self.text_workers * 2:
+                    yield window.popleft().result()
+
+            while window:
+                yield window.popleft().result()
+
+    def draw_frame_text(self, entry, size, save_dir=None, cached=None, data=None):
+        img_file, frame_num, source_index, save = entry
+        if cached:
+            img = Image.fromarray(cached[img_file])
+        else:
+            with (io.BytesIO(data) if data is not None else open_frame(img_file)) as fh, Image.open(fh) as img:
+                img = img.convert('RGB')
+        if img.size != size:
+            img = img.resize(size)
+
+        lines = []
+        for field in self.text_fields:
+            if field == "frame":
+                lines.append("Frame: " + str(frame_num))
+            elif field == "index":
+                lines.append("Source frame: " + str(source_index))
+            elif field == "filename":
+                lines.append(path.basename(img_file))
+
+        draw = ImageDraw.Draw(img)
+        draw.text((img.size[0]/20, 0), "\n".join(lines), (0,0,0), font=self.get_font())
+
+        if save_dir and save:
+            img.save(self.image_output_path(save_dir, sequence_number=frame_num + 1))
+
+        return img.tobytes()
+
+    def get_font(self):
+        # FreeType fonts can't be shared between threads, so each worker loads the font once and keeps it
+        font = getattr(self.font_cache, "font", None)
+        if font is None:
+            try:
+                font = ImageFont.truetype(font_path, 30)
+            except OSError:
+                font = ImageFont.load_default()
+            self.font_cache.font = font
+        return font
+
+
+    def run_sheet(self, name, file_list, source_indexes, frame_numbers, outpath, filetype, framerate, folder=None):
+        print("Tiling: %s\nStarting frame: %d\nTiles: %d\nSaving index to: %s" % (name, self.starting_frame, len(file_list), outpath))
+
+        # the sheet is written on the encode pool while the next folder is set up, so its name is handed over instead of read from self
+        write = self.metrics.timed(name, "encode", self.write_sheet, len(file_list), outpath)
+        write_args = (name, file_list, source_indexes, frame_numbers, outpath, filetype, framerate, folder)
+        if self.executor:
+            future = self.executor.submit(write, *write_args)
+            self.encode_jobs.append((name, outpath, future))
+            return future
+
+        return write(*write_args)
+
+    def write_sheet(self, name, file_list, source_indexes, frame_numbers, outpath, filetype, framerate, folder=None):
+        # Tiles are placed into one page at a time, which is saved as "<index name>_<page>.png" once it's full,
+        # so only a page and the frames being shrunk are held in memory. Sheets have the frame number from the file name
+        # drawn on each tile, source_indexes are the positions of the frames in their folder, counted like --starting_frame.
+        cached = {}
+        if self.frame_cache:
+            cached = self.cached_frames(file_list, folder)
+
+        if cached:
+            first = cached[file_list[0]]
+            size = (first.shape[1], first.shape[0])
+        else:
+            with open_frame(file_list[0]) as fh, Image.open(fh) as img:
+                size = img.size
+        tile_size = (self.tile_width, max(1, round(self.tile_width * size[1] / size[0])))
+        tile_w, tile_h = tile_size
+        per_page = self.sheet_columns * self.sheet_rows
+        stem = splitext(outpath)[0]
+
+        labels = frame_numbers if filetype == "sheet" else [None] * len(file_list)
+        pages = []
+        tiles = []
+        page = None
+        for i, tile in enumerate(self.sheet_tiles(file_list, labels, tile_size, cached)):
+            slot = i % per_page
+            if slot == 0:
+                if page is not None:
+                    pages.append(self.save_sheet_page(page, stem, len(pages) + 1))
+                page = np.zeros((self.sheet_rows * tile_h, self.sheet_columns * tile_w, 3), dtype=np.uint8)
+
+            x = slot % self.sheet_columns * tile_w
+            y = slot // self.sheet_columns * tile_h
+            page[y:y + tile_h, x:x + tile_w] = tile
+            tiles.append({"frame": i + 1, "source_frame": frame_numbers[i], "position": source_indexes[i],
+                          "file": path.basename(file_list[i]), "page": len(pages), "x": x, "y": y})
+
+        # the last page is cut down to the rows it uses
+        rows_used = (len(file_list) - 1) % per_page // self.sheet_columns + 1
+        pages.append(self.save_sheet_page(page[:rows_used * tile_h], stem, len(pages) + 1))
+
+        with open(outpath, "w", encoding="utf-8") as f:
+            json.dump({"name": name, "type": filetype, "framerate": framerate, "tile_width": tile_w, "tile_height": tile_h,
+                       "columns": self.sheet_columns, "rows": self.sheet_rows, "pages": pages, "tiles": tiles}, f, indent=1)
+        return 0
+
+    def save_sheet_page(self, page, stem, number):
+        pagepath = "%s_%d.png" % (stem, number)
+        Image.fromarray(page).save(pagepath)
+        return path.basename(pagepath)
+
+    def sheet_tiles(self, file_list, labels, tile_size, cached=None):
+        # frames are shrunk on a pool of threads, only a couple of frames per thread are held in memory at once
+        window = deque()
+        sources = [None] * len(file_list)
+        if self.prefetcher and not cached:
+            sources = self.prefetcher.read(file_list)
+
+        with ThreadPoolExecutor(max_workers=self.text_workers) as pool:
+            for f, label, data in zip(file_list, labels, sources):
+                window.append(pool.submit(self.make_tile, f, label, tile_size, cached, data))
+                if len(window) >= self.text_workers * 2:
+                    yield window.popleft().result()
+
+            while window:
+                yield window.popleft().result()
+
+    def make_tile(self, f, label, tile_size, cached=None, data=None):
+        if cached:
+            frame = cached[f]
+        else:
+            with (io.BytesIO(data) if data is not None else open_frame(f)) as fh, Image.open(fh) as img:
+                # JPEGs are decoded at the smallest size that's still bigger than the tile
+                img.draft("RGB", tile_size)
+                frame = np.asarray(img.convert("RGB"))
+
+        # frames are averaged over blocks of the largest whole factor that keeps them at least as big as the tile,
+        # then resized the rest of the way
+        factor = min(frame.shape[1] // tile_size[0], frame.shape[0] // tile_size[1])
+        if factor > 1:
+            h = frame.shape[0] // factor * factor
+            w = frame.shape[1] // factor * factor
+            frame = frame[:h, :w].reshape(h // factor, factor, w // factor, factor, 3).mean(axis=(1, 3)).astype(np.uint8)
+
+        tile = Image.fromarray(frame)
+        if tile.size != tile_size:
+            tile = tile.resize(tile_size, Image.BILINEAR)
+        if label is not None:
+            ImageDraw.Draw(tile).text((2, 2), str(label), (255, 255, 255), font=ImageFont.load_default(), stroke_width=1, stroke_fill=(0, 0, 0))
+        return np.asarray(tile)
+
+    def parse_ranges(self, spec):
+        # "1:100,-200:,::10" -> [(1, 100, 1), (-200, None, 1), (None, None, 10)]
+        ranges = []
+        for part in spec.split(","):
+            values = part.strip().split(":")
+            if len(values) > 3:
+                raise ValueError(part)
+            values = [int(v) if v.strip() else None for v in values] + [None] * (3 - len(values))
+            start, end, step = values
+            if start == 0 or end == 0 or (step is not None and step < 1):
+                raise ValueError("%s (frames are counted from 1 and steps must be positive)" % part)
+            ranges.append((start, end, step or 1))
+        return ranges
+
+    def resolve_range(self, frame_range, length):
+        # turns a range of frame numbers counted from 1 (end included) into list indexes for a folder of `length` frames
+        start, end, step = frame_range
+        if start is None:
+            first = 0
+        elif start > 0:
+            first = start - 1
+        else:
+            first = length + start
+        if end is None:
+            last = length
+        elif end > 0:
+            last = end
+        else:
+            last = length + end + 1
+        return max(first, 0), min(max(last, 0), length), step
+
+    def create_range_animations(self, folder, diroutpath, framerate, filetype, reverse, mirror_list, ask=False):
+        # Every range is cut from one decode of the frames they cover: the frames are split to one branch per range,
+        # and each branch is trimmed, stepped and reordered inside the same FFMPEG filter graph.
+        # Reversed ranges are cut from the frames streamed in reverse, so no branch has to hold its frames to reverse them.
+        # Mirrored ranges still do, FFMPEG keeps every frame of a mirrored range in memory until its first half is played.
+        files = folder.files()
+        windows = []
+        for frame_range in self.ranges:
+            first, last, step = self.resolve_range(frame_range, len(files))
+            count = len(range(first, last, step))
+            if count < 1:
+                print("Range %s has no frames in %s (%d frames)" % (":".join("" if v is None else str(v) for v in frame_range), folder.name, len(files)))
+                continue
+
+            # ranges go through the same --overwrite policy as whole animations
+            name = "%s_%d-%d" % (folder.name, first + 1, last)
+            if step > 1:
+                name += "_every%d" % step
+            existing = path.join(diroutpath, "%s.%s" % (name, filetype))
+            if ask and not self.confirm_file_changes(existing):
+                print("Didn't confirm: %s" % existing)
+                continue
+            outpath = self.output_path(diroutpath, name, filetype)
+            if outpath is None:
+                print("Skipping existing animation: %s" % existing)
+                continue
+            windows.append((first, last, step, count, outpath))
+
+        if not windows:
+            return None
+
+        lo = min(window[0] for window in windows)
+        hi = max(window[1] for window in windows)
+        self.set_info(folder.name, starting_frame=lo + 1, length=len(files), frames=hi - lo)
+
+        graph = ["[0:v]split=%d%s" % (len(windows), "".join("[s%d]" % i for i in range(len(windows))))]
+        outputs = []
+        for i, (first, last, step, count, outpath) in enumerate(windows):
+            if reverse:
+                # the streamed frames run from hi - 1 down to lo, so the range starts on its last stepped frame
+                start = hi - 1 - (first + step * (count - 1))
+                end = hi - first
+            else:
+                start, end = first - lo, last - lo
+            branch = "[s%d]trim=start_frame=%d:end_frame=%d,select='not(mod(n\\,%d))'" % (i, start, end, step)
+            if mirror_list and count > 2:
+                # same as frame_order: the reversed copy leaves out both end frames
+                branch += ",split[f%d][m%d];[m%d]reverse,trim=start_frame=1:end_frame=%d[r%d];[f%d][r%d]concat=n=2" % (i, i, i, count - 1, i, i, i)
+            graph.append(branch + ",setpts=N/(%d*TB)[o%d]" % (framerate, i))
+            outputs.append((outpath, first, count))
+
+        print("Animating %d ranges of %s from frames %d to %d" % (len(windows), folder.name, lo + 1, hi))
+        for outpath, first, count in outputs:
+            print("Saving file to: %s (%d frames)" % (outpath, count))
+
+        outputargs = ['-filter_complex', ";".join(graph)]
+        for i, (outpath, first, count) in enumerate(outputs):
+            outputargs += ['-map', '[o%d]' % i, '-r', str(framerate), outpath]
+
+        file_list = files[lo:hi]
         if reverse:
-            file_list = [ele for ele in reversed(file_list)]
-
-        # create animation file for the frames collected from dirpath
-        self.run_FFMPEG(file_list, dirpath, end_frame, outpath, framerate, mirror_list)
-
-        if Render_Frame_Text:
-            # outpathdirs = listdir(diroutpath)
-            # framesWithTextDir = self.set_valid_dirname(outpathdirs, diroutpath, filename + "_frameTextRendered")
-            new_dir_name = no_info_filename + "_frameTextRendered"
-            frameTextRender_dir = join(self.animator_output_path, new_dir_name)
-            if not path.exists(frameTextRender_dir):
-                mkdir(frameTextRender_dir)
-
-            outpathdirs = listdir(frameTextRender_dir)
-            framesWithTextDir = self.set_valid_dirname(outpathdirs, frameTextRender_dir, new_dir_name)
-            print("framesWithTextDir: " + framesWithTextDir)
-            fontPath = '/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf'
-            i = 0
-            new_file_list = []
-            for img_file in file_list:
-                with Image.open(img_file) as img:
-                    newfilename = self.image_output_path(framesWithTextDir, sequence_number=i)
-                    print("newfilename: " + str(newfilename))
-                    img = img.convert('RGB')
-                    font = ImageFont.truetype(fontPath, 30)
-                    txt = "Frame: " + str(i)
-                    i += 1
-                    draw = ImageDraw.Draw(img)
-                    draw.text((img.size[0]/20, 0), txt, (0,0,0), font=font)
-                    img.save(newfilename)
-                    # new_file_list.append(newfilename)
-
-            # newdirpath = self.set_valid_dirname(dirs, dirpath, filename + "_frameTextRendered")
-            new_frame_rendered_filename = f"fr_{filename}"
-            new_file_list = self.confirm_files(framesWithTextDir)
-            newoutpath = self.set_valid_filename(frameTextRender_dir, new_frame_rendered_filename, filetype)
-            self.run_FFMPEG(new_file_list, framesWithTextDir, end_frame, newoutpath, framerate, mirror_list)
-
-
-    def run_FFMPEG(self, file_list, dirpath, end_frame, outpath, framerate, mirror_list):
-        filelistpath = path.join(dirpath, "filelisttoanimation.txt")
-        with open(filelistpath, "w", encoding="utf-8") as txtfile:
-            for image in file_list:
-                txtfile.write("file \'" + image + "\'\n")
+            file_list = file_list[::-1]
 
-            if mirror_list:
-                reversed_list = [ele for ele in reversed(file_list)][1:]
-                for image in reversed_list[:-1]:
-                    txtfile.write("file \'" + image + "\'\n")
+        outpaths = [outpath for outpath, _, _ in outputs]
+        encode = self.metrics.timed(folder.name, "encode", self.encode_ranges, hi - lo, outpaths)
+        encode_args = (outputargs, file_list, folder, outputs, filetype, framerate, reverse, mirror_list)
+        if self.executor:
+            future = self.executor.submit(encode, *encode_args)
+            self.encode_jobs.append((folder.name, ", ".join(outpaths), future))
+            self.settle_outputs(future, outpaths)
+            return future
 
-        # listpath = filelistpath
-        listpath = self.escape_str(filelistpath)
+        try:
+            returncode = encode(*encode_args)
+        except Exception:
+            self.settle_outputs(None, outpaths)
+            raise
+        self.settle_outputs(returncode, outpaths)
+        return returncode
+
+    def encode_ranges(self, outputargs, file_list, folder, outputs, filetype, framerate, reverse, mirror_list):
+        frames, input_args = self.frame_source(file_list, folder)
+        cmdargs = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-y', '-framerate', str(framerate)] + \
+                  (input_args or ['-f', 'image2pipe']) + ['-i', 'pipe:0'] + outputargs
+        returncode = self.pipe_frames(cmdargs, frames, [outpath for outpath, _, _ in outputs])
+        if returncode == 0:
+            for outpath, first, count in outputs:
+                self.catalog.record_output(folder.path, outpath, filetype, framerate, first + 1, count, reverse, mirror_list)
+        return returncode
+
+    def parse_outputs(self, spec):
+        # "mp4,gif:320" is a full size mp4 and a gif scaled to 320 pixels wide
+        outputs = []
+        for entry in spec.split(","):
+            filetype, _, width = entry.strip().partition(":")
+            if not filetype:
+                raise ValueError("empty output in %r" % spec)
+            if width and (not width.isnumeric() or int(width) < 2):
+                raise ValueError("%r isn't a width" % width)
+            output = (filetype.lower(), int(width) if width else None)
+            if output in outputs:
+                raise ValueError("%s is listed twice" % entry.strip())
+            outputs.append(output)
+        return outputs
+
+    def outputs_paths(self, diroutname, filetype, filename):
+        # each output goes in the output folder of its own file type, scaled outputs have their width added to their name
+        base = diroutname[:-len("_%s_output" % filetype)]
+        outputs = []
+        for output_type, width in self.outputs:
+            diroutpath = self.set_sorted_folder("%s_%s_output" % (base, output_type), output_type)
+            name = filename if width is None else "%s_%d" % (filename, width)
+            outpath = self.output_path(diroutpath, name, output_type)
+            if outpath is None:
+                print("Skipping existing animation: %s" % path.join(diroutpath, "%s.%s" % (name, output_type)))
+                continue
+            outputs.append((outpath, output_type, width))
+        return outputs
+
+    def outputs_graph(self, outputs):
+        # The decoded frames are split to one branch per output, each one scaled on its own. GIFs share one palette made from
+        # the whole clip, so paletteuse holds a GIF's frames until every frame has been seen.
+        gifs = [i for i, (_, output_type, _) in enumerate(outputs) if output_type == "gif"]
+        branches = len(outputs) + (1 if gifs else 0)
+        graph = ["[0:v]split=%d%s" % (branches, "".join("[s%d]" % i for i in range(branches)))]
+        if gifs:
+            graph.append("[s%d]palettegen=stats_mode=full,split=%d%s" % (len(outputs), len(gifs), "".join("[p%d]" % i for i in gifs)))
+
+        for i, (_, output_type, width) in enumerate(outputs):
+            branch = "[s%d]" % i + ("scale=%d:-2:flags=lanczos" % width if width else "null")
+            if output_type == "gif":
+                branch += "[g%d];[g%d][p%d]paletteuse" % (i, i, i)
+            graph.append(branch + "[o%d]" % i)
+        return ";".join(graph)
+
+    def run_FFMPEG_outputs(self, file_list, outputs, end_frame, framerate, mirror_list, reverse, folder=None):
+        print("Animating: %s\nStarting frame: %d\nEnd Frame: %d\nFile List Length: %d" % (self.name, self.starting_frame, end_frame, self.frames))
+        for outpath, _, width in outputs:
+            print("Saving file to: %s%s" % (outpath, " (%d wide)" % width if width else ""))
+
+        outputargs = ['-filter_complex', self.outputs_graph(outputs)]
+        for i, (outpath, _, _) in enumerate(outputs):
+            outputargs += ['-map', '[o%d]' % i, '-r', str(framerate), outpath]
+
+        file_list = self.frame_order(file_list, mirror_list)
+        encode = self.metrics.timed(self.name, "encode", self.encode_outputs, len(file_list), [outpath for outpath, _, _ in outputs])
+        encode_args = (outputargs, file_list, folder, outputs, framerate, self.starting_frame, self.frames, reverse, mirror_list)
+        if self.executor:
+            future = self.executor.submit(encode, *encode_args)
+            self.encode_jobs.append((self.name, ", ".join(outpath for outpath, _, _ in outputs), future))
+            return future
+
+        return encode(*encode_args)
+
+    def encode_outputs(self, outputargs, file_list, folder, outputs, framerate, starting_frame, frames, reverse, mirror_list):
+        frames_in, input_args = self.frame_source(file_list, folder)
+        cmdargs = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-y', '-framerate', str(framerate)] + \
+                  (input_args or ['-f', 'image2pipe']) + ['-i', 'pipe:0'] + outputargs
+        returncode = self.pipe_frames(cmdargs, frames_in, [outpath for outpath, _, _ in outputs])
+        if returncode == 0 and folder:
+            for outpath, output_type, width in outputs:
+                self.catalog.record_output(folder.path, outpath, output_type, framerate, starting_frame, frames, reverse, mirror_list, width)
+        return returncode
+
+    def settle_outputs(self, result, outpaths):
+        # output files made for an encode are removed when it fails, result is its return code or future
+        if hasattr(result, "add_done_callback"):
+            result.add_done_callback(lambda f: self.settle_outputs(f.exception() or f.result(), outpaths))
+            return
+        for outpath in outpaths:
+            self.names.settle(outpath, result == 0)
+
+    def catalog_output(self, result, dirpath, outpath, filetype, framerate, reverse, mirror_list):
+        # outputs are only added to the catalog once FFMPEG has finished them
+        args = (dirpath, outpath, filetype, framerate, self.starting_frame, self.frames, reverse, mirror_list)
+        if hasattr(result, "add_done_callback"):
+            result.add_done_callback(lambda f: f.exception() is None and f.result() == 0 and self.catalog.record_output(*args))
+        elif result == 0:
+            self.catalog.record_output(*args)
+
+    def create_incremental_animation(self, folder, diroutpath, framerate, filetype):
+        # Keeps the encoded segments of a folder next to its animation, with a manifest of the frame numbers each one covers.
+        # New frames are encoded into one more segment and the animation is rebuilt from the segments with a stream copy.
+        segmentdir = path.join(diroutpath, folder.name + "_segments")
+        manifestpath = path.join(segmentdir, "segments.json")
+        files = folder.files()
+        numbers = folder.frame_numbers()
+
+        manifest = None
+        if path.exists(manifestpath):
+            with open(manifestpath, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+
+            # segments can't be reused if the framerate changed or frames they cover were added or removed
+            last = manifest["segments"][-1]["last"] if manifest["segments"] else None
+            covered = 0 if last is None else sum(1 for num in numbers if num <= last)
+            if manifest["framerate"] != framerate or covered != sum(segment["frames"] for segment in manifest["segments"]):
+                print("Frames of %s changed since its segments were made, encoding it again." % folder.name)
+                for segment in manifest["segments"]:
+                    if path.exists(path.join(segmentdir, segment["file"])):
+                        remove(path.join(segmentdir, segment["file"]))
+                manifest["segments"] = []
+                manifest["framerate"] = framerate
+        else:
+            if not path.exists(segmentdir):
+                mkdir(segmentdir)
+            # the incremental animation gets its own name the first time, after that it's updated in place
+            outpath = self.set_valid_filename(diroutpath, folder.name, filetype)
+            manifest = {"output": path.basename(outpath), "framerate": framerate, "segments": []}
+
+        outpath = path.join(diroutpath, manifest["output"])
+        last = manifest["segments"][-1]["last"] if manifest["segments"] else None
+        new = [i for i, num in enumerate(numbers) if last is None or num > last]
+
+        if not new and path.exists(outpath):
+            print("%s is up to date. (%d frames)" % (outpath, len(files)))
+            return 0
 
+        self.set_info(folder.name, starting_frame=new[0] + 1 if new else 1, length=len(files), frames=len(new))
+        print("Animating: %s\nNew frames: %d\nTotal frames: %d\nSaving file to: %s" % (folder.name, len(new), len(files), outpath))
+
+        update = self.metrics.timed(folder.name, "encode", self.update_segments, len(new), outpath)
+        update_args = (manifest, manifestpath, segmentdir, [files[i] for i in new], [numbers[i] for i in new], outpath, framerate)
+        if self.executor:
+            future = self.executor.submit(update, *update_args)
+            self.encode_jobs.append((folder.name, outpath, future))
+            self.settle_outputs(future, [outpath])
+            return future
+
+        try:
+            returncode = update(*update_args)
+        except Exception:
+            self.settle_outputs(None, [outpath])
+            raise
+        self.settle_outputs(returncode, [outpath])
+        return returncode
+
+    def update_segments(self, manifest, manifestpath, segmentdir, file_list, numbers, outpath, framerate):
+        if file_list:
+            segmentname = "segment_%06d%s" % (len(manifest["segments"]) + 1, path.splitext(outpath)[1])
+            returncode = self.encode_frames(self.read_frames(file_list), path.join(segmentdir, segmentname), framerate)
+            if returncode != 0:
+                return returncode
+
+            manifest["segments"].append({"file": segmentname, "first": numbers[0], "last": numbers[-1], "frames": len(file_list)})
+            with open(manifestpath, "w", encoding="utf-8") as f:
+                json.dump(manifest, f, indent=1)
+
+        return self.join_segments(segmentdir, [segment["file"] for segment in manifest["segments"]], outpath)
+
+    def join_segments(self, segmentdir, segment_files, outpath):
+        # segments are joined with the concat demuxer without re-encoding, then moved over the old animation
+        listpath = path.join(segmentdir, "segmentlist.txt")
+        with open(listpath, "w", encoding="utf-8") as txtfile:
+            for segment in segment_files:
+                txtfile.write("file \'" + self.escape_str(path.join(segmentdir, segment)) + "\'\n")
+
+        temppath = path.join(segmentdir, "joined" + path.splitext(outpath)[1])
+        cmdargs = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-y', '-f', 'concat', '-safe', "0",
+                   '-i', listpath, '-c', 'copy', temppath]
+        returncode = self.pipe_frames(cmdargs, [])
+        if returncode == 0:
+            replace(temppath, outpath)
+        return returncode
+
+    def run_FFMPEG(self, file_list, dirpath, end_frame, outpath, framerate, mirror_list, folder=None):
         print("Animating: %s\nStarting frame: %d\nEnd Frame: %d\nFile List Length: %d\nSaving file to: %s" % (
             self.name, self.starting_frame, end_frame, self.frames, outpath))
-        # outpathStr = outpath
-        outpathStr = self.escape_str(outpath)
-
-        cmdargs = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-y', '-r',
-                   str(framerate), '-f', 'concat', '-safe', "0", '-i', listpath, outpathStr]
-        subprocess.call(cmdargs)
 
-    def set_valid_dirname(self, dirs, out, basename, i=0):
-        if i > 0:
-            newname = "%s(%d)" % (basename, i)
+        if self.encoder == "concat":
+            encode, encode_args = self.pipe_frames, (self.concat_cmdargs(file_list, dirpath, outpath, framerate, mirror_list), [])
+        elif self.chunks > 1 and path.splitext(outpath)[1][1:] in segment_file_types and len(file_list) >= self.chunks * 2:
+            encode, encode_args = self.encode_chunks, (self.frame_order(file_list, mirror_list), outpath, framerate, folder)
         else:
-            newname = basename
+            encode, encode_args = self.encode_file_list, (self.frame_order(file_list, mirror_list), outpath, framerate, folder)
+
+        encode = self.metrics.timed(self.name, "encode", encode, len(self.frame_order(file_list, mirror_list)), outpath)
+        if self.executor:
+            future = self.executor.submit(encode, *encode_args)
+            self.encode_jobs.append((self.name, outpath, future))
+            return future
+
+        return encode(*encode_args)
+
+    def encode_chunks(self, file_list, outpath, framerate, folder=None):
+        # Long animations are split into chunks that are encoded at the same time. Every chunk starts on a keyframe,
+        # so they are joined without re-encoding and the animation keeps the same frames and timing as a single encode.
+        chunk_size = -(-len(file_list) // self.chunks)
+        chunks = [file_list[i:i + chunk_size] for i in range(0, len(file_list), chunk_size)]
+        ext = path.splitext(outpath)[1]
+        chunk_files = ["chunk_%04d%s" % (i, ext) for i in range(len(chunks))]
+        chunkdir = tempfile.mkdtemp(prefix=".chunks_", dir=path.dirname(outpath))
+        try:
+            with ThreadPoolExecutor(max_workers=len(chunks)) as pool:
+                name = folder.name if folder else path.basename(outpath)
+                returncodes = list(pool.map(lambda chunk, chunk_file: self.metrics.timed(name, "encode_chunk", self.encode_file_list, len(chunk))(
+                    chunk, path.join(chunkdir, chunk_file), framerate, folder), chunks, chunk_files))
 
-        unique_dir_name = True
+            for returncode in returncodes:
+                if returncode != 0:
+                    return returncode
 
-        if len(dirs) < 1:
-            new_path = path.join(out, newname)
-            mkdir(new_path)
-            return new_path
+            return self.join_segments(chunkdir, chunk_files, outpath)
+        finally:
+            shutil.rmtree(chunkdir, ignore_errors=True)
 
-        for dir in dirs:
-            if path.basename(dir) == newname:
-                unique_dir_name = False
-                break
+    def concat_cmdargs(self, file_list, dirpath, outpath, framerate, mirror_list):
+        # writes the frame list into the frame folder for FFMPEG's concat demuxer
+        filelistpath = path.join(dirpath, "filelisttoanimation.txt")
+        with open(filelistpath, "w", encoding="utf-8") as txtfile:
+            # this is to fix file paths that include Windows styled paths and apostrophes
+            for image in self.frame_order(file_list, mirror_list):
+                txtfile.write("file \'" + self.escape_str(image) + "\'\n")
 
-        if unique_dir_name:
-            print(f"out: {out}\nnewname: {newname}")
-            new_path = path.join(out, newname)
+        listpath = self.escape_str(filelistpath)
+        outpathStr = self.escape_str(outpath)
 
-            mkdir(new_path)
-            return new_path
+        return ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-y', '-r',
+                str(framerate), '-f', 'concat', '-safe', "0", '-i', listpath, outpathStr]
+
+    def frame_order(self, file_list, mirror_list):
+        # mirrored animations play the frames back in reverse, leaving out both end frames so the loop doesn't stutter
+        if not mirror_list:
+            return file_list
+        return file_list + file_list[-2:0:-1]
+
+    def encode_file_list(self, file_list, outpath, framerate, folder=None, build=True):
+        frames, input_args = self.frame_source(file_list, folder, build)
+        return self.encode_frames(frames, outpath, framerate, input_args)
+
+    def frame_source(self, file_list, folder=None, build=True):
+        # frames are read from the decoded frame cache when it's turned on, otherwise the image files are streamed as they are
+        if self.frame_cache and file_list:
+            build_files = None
+            if build:
+                build_files = folder.files() if folder else sorted(set(file_list))
+            cached = self.frame_cache.load(folder.path if folder else path.dirname(file_list[0]), file_list, build_files)
+            if cached:
+                frames, indexes = cached
+                return (memoryview(frames[i]) for i in indexes), self.raw_input_args((frames.shape[2], frames.shape[1]))
+
+        return self.read_frames(file_list), None
+
+    def cached_frames(self, file_list, folder=None):
+        # the decoded frame of each file from the frame cache, or nothing when they're too big to be cached
+        cached = self.frame_cache.load(folder.path if folder else path.dirname(file_list[0]), file_list,
+                                       folder.files() if folder else sorted(set(file_list)))
+        if not cached:
+            return {}
+        frames, indexes = cached
+        return {f: frames[i] for f, i in zip(file_list, indexes)}
+
+    def read_frames(self, file_list):
+        if self.prefetcher:
+            yield from self.prefetcher.read(file_list)
+            return
 
-        return self.set_valid_dirname(dirs, out, basename, i + 1)
+        for image in file_list:
+            with open_frame(image) as f:
+                yield f.read()
+
+    def raw_input_args(self, size, pix_fmt="rgb24"):
+        # input arguments for frames that are streamed as raw pixels instead of image files
+        return ['-f', 'rawvideo', '-pix_fmt', pix_fmt, '-s', "%dx%d" % size]
+
+    def encode_frames(self, frames, outpath, framerate, input_args=None):
+        # streams frames to FFMPEG's stdin, so nothing needs to be written next to the source frames
+        if input_args is None:
+            input_args = ['-f', 'image2pipe']
+
+        cmdargs = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-y', '-framerate', str(framerate)] + \
+                  input_args + ['-i', 'pipe:0', outpath]
+        return self.pipe_frames(cmdargs, frames, [outpath])
+
+    def pipe_frames(self, cmdargs, frames, outpaths=()):
+        # outpaths are removed if reading the frames fails, so FFMPEG can't finish a shortened animation in their place
+        progress_reader = None
+        if self.metrics.enabled():
+            # FFMPEG reports its progress on stdout, which is read on its own thread so it never blocks the encode
+            cmdargs = cmdargs[:1] + ['-progress', 'pipe:1', '-nostats'] + cmdargs[1:]
+            proc = subprocess.Popen(cmdargs, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            progress_reader = threading.Thread(target=self.metrics.read_progress, daemon=True, args=(
+                proc.stdout, getattr(self.metrics.current, "folder", None), getattr(self.metrics.current, "stage", None)))
+            progress_reader.start()
+        else:
+            proc = subprocess.Popen(cmdargs, stdin=subprocess.PIPE)
+
+        try:
+            for frame in frames:
+                proc.stdin.write(frame)
+        except BrokenPipeError:
+            # FFMPEG stopped reading, its error is shown through the return code
+            pass
+        except BaseException:
+            proc.kill()
+            proc.wait()
+            if progress_reader:
+                progress_reader.join()
+            for outpath in outpaths:
+                if isfile(outpath):
+                    remove(outpath)
+            raise
+        finally:
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+
+        returncode = proc.wait()
+        if progress_reader:
+            progress_reader.join()
+        return returncode
+
+    def report_animation(self, name, result):
+        # reports an animation made without --jobs, result is an AnimationResult, or the return code of incremental and range encodes
+        # skipped animations and ranges that had nothing to make were already reported when they were skipped
+        if result is None or isinstance(result, AnimationResult) and result.status == "skipped":
+            return
+        try:
+            if isinstance(result, AnimationResult):
+                if result.wait().status == "failed":
+                    raise result.error
+            else:
+                returncode = result.result() if hasattr(result, "add_done_callback") else result
+                if returncode != 0:
+                    raise RuntimeError("FFMPEG exited with code %d" % returncode)
+            print("Animation file completed.")
+        except Exception as e:
+            print("Animation of %s failed: %s" % (name, e))
+            self.failed.append((name, e))
+
+    def wait_for_encodes(self):
+        # reports queued encodes in the order they were submitted, failures don't stop the rest of the run
+        total = len(self.encode_jobs)
+        failed = []
+        for i, (name, outpath, job) in enumerate(self.encode_jobs, 1):
+            try:
+                if isinstance(job, Exception):
+                    raise job
+                returncode = job.result()
+                if returncode != 0:
+                    raise RuntimeError("FFMPEG exited with code %d" % returncode)
+                print("[%d/%d] Animation file completed: %s" % (i, total, outpath))
+            except Exception as e:
+                print("[%d/%d] Animation of %s failed: %s" % (i, total, name, e))
+                failed.append((name, e))
+
+        self.executor.shutdown()
+        self.executor = None
+        self.encode_jobs = []
+        self.failed = failed
+
+        if failed:
+            print("\n%d of %d animations failed:" % (len(failed), total))
+            for name, e in failed:
+                print("  %s: %s" % (name, e))
+
+    def set_valid_dirname(self, dirs, out, basename, i=0):
+        # makes the first unused "basename(N)" folder in out, dirs and i are no longer needed and only kept for older callers
+        new_path = self.names.new_dir(out, basename)
+        print(f"out: {out}\nnewname: {path.basename(new_path)}")
+        return new_path
 
     def get_filename(self, filename):
         namestr = filename.split(".")
@@ -315,17 +2371,17 @@ class MLAnimator:
         rename(unsortedfile, path.join(sortedpath, f))
 
     def set_valid_filename(self, filepath, basename, filetype, i=0):
-        if i > 0:
-            newname = "%s(%d)" % (basename, i)
-        else:
-            newname = basename
-
-        newpath = "%s.%s" % (newname, filetype)
-        filename = path.join(filepath, newpath)
-        if isfile(filename):
-            return self.set_valid_filename(filepath, basename, filetype, i + 1)
-
-        return filename
+        # the next unused "basename(N).filetype" in filepath, made as an empty file so no other encode can take it
+        return self.names.new_file(filepath, basename, filetype)
+
+    def output_path(self, filepath, basename, filetype):
+        # "overwrite" reuses the animation's path, "skip" gives None when it's already there, otherwise the next unused numbered name is used
+        outpath = path.join(filepath, "%s.%s" % (basename, filetype))
+        if self.overwrite == "overwrite" and self.names.claim(outpath):
+            return outpath
+        if self.overwrite == "skip" and (isfile(outpath) or self.names.is_claimed(outpath)):
+            return None
+        return self.set_valid_filename(filepath, basename, filetype)
 
     def confirm_file_changes(self, outpath):
         if isfile(outpath):
@@ -457,8 +2513,11 @@ class MLAnimator:
                 self.starting_frame = 1
                 self.frames = self.length
                 return True
-        if self.frames >= self.length:
+        # asking for exactly every frame is valid, only more than the folder has needs a new selection
+        if self.frames > self.length:
             print(f"Selected too many frames from: {self.name}")
+            if not self.interactive:
+                return False
             select = input("Set to max frame amount %d? (y/n): " % (self.length))
             if select.strip().lower() in ("yes", "y"):
                 self.starting_frame = 1
@@ -488,7 +2547,264 @@ class MLAnimator:
             mkdir(diroutpath)
         return diroutpath
 
+class Animator(MLAnimator):
+    # Makes animations from a directory of sorted frame folders without asking anything, for running MLAnimator inside another program.
+    # The directory is scanned once and the FFMPEG workers are kept between jobs, refresh() picks up frames added since.
+    def __init__(self, dir, jobs=1, encoder="pipe", text_fields=("frame",), chunks=1, frame_cache=False, cache_size=4096,
+                 sort=True, metrics=None, metrics_callback=None, prefetch=0, prefetch_window=32):
+        self.configure(jobs, encoder, text_fields, chunks=chunks, metrics=metrics, metrics_callback=metrics_callback,
+                       prefetch=prefetch, prefetch_window=prefetch_window)
+        self.open_output(frame_cache, cache_size)
+        self.dir = dir
+        self.index = None
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=jobs)
+        self.refresh(sort)
+
+    def refresh(self, sort=True):
+        # scans the directory again, sorting any new frames into their folders first when sort is set
+        with self.lock:
+            if is_archive(self.dir):
+                if self.index:
+                    self.index.archive.close()
+                with self.metrics.stage(self.dir, "scan"):
+                    self.index = ArchiveIndex(self.dir)
+                # frames in archives can only be streamed to FFMPEG
+                self.encoder = "pipe"
+                return
+
+            SortPlan.resume(self.dir)
+            with self.metrics.stage(self.dir, "scan"):
+                self.index = FrameIndex(self.dir)
+
+            if sort and self.index.files:
+                plan = SortPlan(self.index)
+                if not plan.sorted_folder and plan.moves:
+                    with self.metrics.stage(self.dir, "sort", frames=len(plan.moves)):
+                        plan.apply()
+
+    def find_folder(self, folder):
+        if folder in self.index.folders:
+            return self.index.folders[folder]
+        folderpath = path.abspath(folder)
+        for f in self.index.folder_list():
+            if path.abspath(f.path) == folderpath:
+                return f
+        if path.isdir(folderpath):
+            return FrameFolder(folderpath, path.basename(folderpath))
+        return None
+
+    def submit(self, job):
+        # selects the job's frames and queues its encodes, call wait() on the result for it to finish
+        if job.overwrite not in overwrite_policies or job.overwrite == "prompt":
+            raise ValueError("Invalid overwrite policy for a job: %s" % job.overwrite)
+        if job.framerate < 1:
+            raise ValueError("Invalid framerate.")
+        if job.filetype in sheet_file_types and np is None:
+            raise ValueError("numpy is needed for sheets and atlases")
+        for value in (job.starting_frame, job.frames):
+            if value is not None and (not isinstance(value, int) or value < 1):
+                raise ValueError("Invalid frame selection: %r" % value)
+
+        timings = {}
+        with self.lock:
+            folder = self.find_folder(job.folder)
+            if folder is None:
+                result = AnimationResult(str(job.folder), "failed", error=ValueError("No frame folder found: %s" % job.folder))
+            else:
+                self.overwrite = job.overwrite
+                self.set_dedup(job.dedup, job.target_frames)
+                diroutname = archive_name(path.normpath(path.abspath(self.dir))) + "_" + job.filetype + "_output"
+                try:
+                    with self.metrics.collect(timings):
+                        self.catalog.record_folder(folder, folder.mtime_ns())
+                        result = self.create_animation_file(None, folder.path, folder.name, job.framerate, job.frames, job.filetype,
+                                                            job.starting_frame, job.mirror, job.reverse, diroutname, job.info, False,
+                                                            job.render_frame_text, folder=folder)
+                except Exception as e:
+                    result = AnimationResult(folder.name, "failed", error=e)
+                # results are waited on through the AnimationResult, not wait_for_encodes
+                self.encode_jobs = []
+
+                # a finished animation's path can be handed out again, so later jobs can replace it
+                for outpath, encode in zip((result.outpath, result.text_outpath), result.encodes):
+                    if hasattr(encode, "add_done_callback"):
+                        encode.add_done_callback(lambda f, outpath=outpath: self.names.release(outpath))
+
+        result.job = job
+        result.timings = timings
+        return result
+
+    def run(self, jobs):
+        # makes every job and returns their results once they have all finished
+        results = [self.submit(job) for job in jobs]
+        return [result.wait() for result in results]
+
+    def close(self):
+        self.executor.shutdown()
+        self.catalog.close()
+        if isinstance(self.index, ArchiveIndex):
+            self.index.archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class FrameSink:
+    # Encodes the frames a training loop makes straight into AnimatorOutput/<dir>_<filetype>_output/<name>.<filetype>, so no image
+    # has to be written and read back for every iteration. push() hands frames to a background thread that keeps one FFMPEG pipe
+    # open, through a queue of queue_size frames. push() never waits unless block is set: when the queue is full the frame is
+    # dropped and counted in dropped. Every checkpoint_every'th frame can also be saved as <checkpoint_dir>/<name>/<name>.<num>.png,
+    # which MLAnimator sorts and animates like the trainer's own images. Checkpoint frames are never dropped, they wait for room.
+    def __init__(self, name, framerate=14, filetype="mp4", dir=None, queue_size=64, checkpoint_every=0, checkpoint_dir=None, block=False):
+        if framerate < 1:
+            raise ValueError("Invalid framerate.")
+        if queue_size < 1 or checkpoint_every < 0:
+            raise ValueError("Invalid frame sink setting.")
+        if checkpoint_every and not checkpoint_dir:
+            raise ValueError("Checkpoints need a checkpoint_dir")
+
+        # get_filename leaves the dots out of a prefix, so the name can't have any for its checkpoints to sort into its folder
+        self.name = name.replace(".", "")
+        self.framerate = framerate
+        self.filetype = filetype
+        self.block = block
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_dir = checkpoint_dir
+        self.frames = 0
+        self.dropped = 0
+        self.pushed = 0
+        self.size = None
+        self.error = None
+        self.proc = None
+        self.lock = threading.Lock()
+
+        # the output folder is named after the last part of dir or checkpoint_dir, so it's always made in AnimatorOutput
+        if dir is None:
+            dir = checkpoint_dir or "FrameSink"
+        dirname = path.basename(path.normpath(path.abspath(dir)))
+        diroutpath = path.join(getcwd(), "AnimatorOutput", dirname + "_" + filetype + "_output")
+        for folder in (path.dirname(diroutpath), diroutpath):
+            if not path.exists(folder):
+                mkdir(folder)
+        self.outpath = NameAllocator().new_file(diroutpath, self.name, filetype)
+
+        if checkpoint_every:
+            self.checkpoint_folder = path.join(checkpoint_dir, self.name)
+            for folder in (checkpoint_dir, self.checkpoint_folder):
+                if not path.exists(folder):
+                    mkdir(folder)
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = threading.Thread(target=self.run, name="FrameSink-%s" % self.name, daemon=True)
+        self.thread.start()
+
+    def push(self, frame, num=None):
+        # frame is a PIL image or a NumPy array of height x width (x 3 or 4), num is its iteration number for checkpoints.
+        # Returns False when the frame was dropped.
+        with self.lock:
+            self.pushed += 1
+            num = self.pushed if num is None else num
+
+        # the frame is copied so the training loop can keep changing its own
+        frame = frame.copy()
+        try:
+            checkpoint = self.checkpoint_every and num % self.checkpoint_every == 0
+            self.queue.put((frame, num), block=self.block or checkpoint)
+            return True
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+            return False
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if self.error:
+                # FFMPEG has stopped, the rest of the frames are only taken off the queue so push() never waits on it
+                continue
+            try:
+                self.write(*item)
+            except Exception as e:
+                self.error = e
+
+        if self.proc:
+            try:
+                self.proc.stdin.close()
+            except BrokenPipeError:
+                pass
+            returncode = self.proc.wait()
+            if returncode != 0 and not self.error:
+                self.error = RuntimeError("FFMPEG exited with code %d" % returncode)
+
+    def write(self, frame, num):
+        img = self.to_image(frame)
+        if self.checkpoint_every and num % self.checkpoint_every == 0:
+            img.save(path.join(self.checkpoint_folder, "%s.%s.png" % (self.name, str(num).zfill(6))))
+
+        if self.proc is None:
+            # every frame is encoded at the size of the first one
+            self.size = img.size
+            cmdargs = ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-y', '-framerate', str(self.framerate), '-f', 'rawvideo',
+                       '-pix_fmt', 'rgb24', '-s', "%dx%d" % self.size, '-i', 'pipe:0', '-r', str(self.framerate), self.outpath]
+            self.proc = subprocess.Popen(cmdargs, stdin=subprocess.PIPE)
+        if img.size != self.size:
+            img = img.resize(self.size)
+
+        self.proc.stdin.write(img.tobytes())
+        self.frames += 1
+
+    def to_image(self, frame):
+        if isinstance(frame, Image.Image):
+            return frame.convert("RGB")
+        if np is None:
+            raise ImportError("numpy is needed to push arrays")
+        frame = np.asarray(frame)
+        if frame.dtype != np.uint8:
+            # float frames are taken to be from 0 to 1
+            scale = 255 if frame.dtype.kind == "f" else 1
+            frame = np.clip(frame * scale, 0, 255).astype(np.uint8)
+        if frame.ndim == 3 and frame.shape[2] == 4:
+            frame = frame[:, :, :3]
+        return Image.fromarray(frame).convert("RGB")
+
+    def close(self):
+        # waits for the queued frames to be encoded and returns the AnimationResult of the animation
+        self.queue.put(None)
+        self.thread.join()
+        print("Saved %d frames of %s to %s (%d dropped)" % (self.frames, self.name, self.outpath, self.dropped))
+
+        result = AnimationResult(self.name, "completed", self.outpath, 1 if self.frames else None, self.frames, self.error)
+        if self.error or not self.frames:
+            result.status = "failed"
+            result.error = self.error or RuntimeError("No frames were pushed")
+            print("Failed to encode %s: %s" % (self.name, result.error))
+            if not self.frames and isfile(self.outpath):
+                remove(self.outpath)
+        return result
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "query":
+        parser = argparse.ArgumentParser(prog="MLAnimator.py query", description="List the folders that still need animating")
+        parser.add_argument("-dir", "--dir", metavar="./dir/path", help="directory of sorted folders to check", required=True)
+        parser.add_argument("-fr", "--framerate", metavar="20", help="framerate to be used by FFMPEG", default=14)
+        parser.add_argument("-ft", "--filetype", metavar="mp4", help="output file type", default="mp4")
+        parser.add_argument("-r", "--reverse", action="store_true", help="check for reversed animations")
+        parser.add_argument("-m", "--mirror", action="store_true", help="check for mirrored animations")
+        args = parser.parse_args(sys.argv[2:])
+        query_catalog(args.dir, args.filetype, int(args.framerate), args.reverse, args.mirror)
+        sys.exit()
+
     parser = argparse.ArgumentParser(description="Make gifs of image lists in directories")
     parser.add_argument("-dir", "--dir", metavar="./dir/path", help="starting directory to check for files")
     parser.add_argument("-fr", "--framerate", metavar="20", help="framerate to be used by FFMPEG", default=14)
@@ -500,6 +2816,47 @@ if __name__ == "__main__":
     parser.add_argument("-m", "--mirror", action="store_true", help="Turn on mirrored animation (seemless looping, but double filesize)")
     parser.add_argument("-i", "--info", action="store_true", help="add frame info to filename")
     parser.add_argument("-a", "--all", action="store_true", help="use all frames available in animation")
+    parser.add_argument("-ow", "--overwrite", choices=overwrite_policies,
+                        help="what to do when an animation already exists, anything but prompt never asks for input (default: new with -a, otherwise prompt)")
     parser.add_argument("-rt", "--rendertext", action="store_true", help="create a separate animation of images with frame info rendered on the image")
+    parser.add_argument("-rtf", "--rendertext_fields", metavar="frame,index,filename", help="comma separated info to draw with --rendertext: frame (animation frame), index (frame position in its folder), filename", default="frame")
+    parser.add_argument("-rts", "--save_text_frames", action="store_true", help="also save the frames drawn with --rendertext as images")
+    parser.add_argument("-w", "--watch", action="store_true", help="keep sorting new files and updating a preview animation of each prompt's latest frames")
+    parser.add_argument("-pf", "--preview_frames", metavar="50", help="amount of latest frames used in --watch previews", default=50)
+    parser.add_argument("--debounce", metavar="2", help="seconds a prompt has to go without new frames before its --watch preview is updated", default=2.0)
+    parser.add_argument("--preview_interval", metavar="10", help="least amount of seconds between --watch previews of the same prompt", default=10.0)
+    parser.add_argument("--poll", action="store_true", help="poll the --watch directory instead of using inotify")
+    parser.add_argument("-inc", "--incremental", action="store_true", help="only encode frames added since the last incremental run, and join them onto the earlier segments")
+    parser.add_argument("-sk", "--skip_unchanged", action="store_true", help="with --all, skip folders that haven't changed since they were animated with the same settings")
+    parser.add_argument("-ch", "--chunks", metavar="8", help="split each animation into this many chunks encoded at the same time (0 uses every core)", default=1)
+    parser.add_argument("--tile_width", metavar="160", type=int, default=160, help="width of each frame in a sheet or atlas")
+    parser.add_argument("--sheet_columns", metavar="10", type=int, default=10, help="frames across each page of a sheet or atlas")
+    parser.add_argument("--sheet_rows", metavar="10", type=int, default=10, help="rows of frames on each page of a sheet or atlas")
+    parser.add_argument("--sheet_step", metavar="1", type=int, default=1, help="put every Nth selected frame in a sheet or atlas")
+    parser.add_argument("-out", "--outputs", metavar="mp4,gif:320",
+                        help="comma separated file types to make from one decode of the frames, each one can be scaled to a width with :<width>")
+    parser.add_argument("-rg", "--ranges", metavar="1:100,-200:,::10", help="comma separated frame ranges (start:end:step, counted from 1) to animate from each folder in one pass")
+    parser.add_argument("-dd", "--dedup", metavar="4", type=int,
+                        help="drop frames that look like the last kept frame, up to this many of the 64 bits of their hashes may differ (needs numpy)")
+    parser.add_argument("-tf", "--target_frames", metavar="300", type=int,
+                        help="keep this many frames, spread over how much the frames change (needs numpy)")
+    parser.add_argument("-pre", "--prefetch", metavar="8", type=int, default=0,
+                        help="read frames ahead on this many threads for each encode, for frames on slow or network drives")
+    parser.add_argument("--prefetch_window", metavar="32", type=int, default=32, help="most frames read ahead of the one being encoded")
+    parser.add_argument("-fc", "--frame_cache", action="store_true", help="decode each folder's frames once into a memory-mapped cache that later encodes read from (needs numpy)")
+    parser.add_argument("--cache_size", metavar="4096", help="size limit of the frame cache in MB, the least recently used folders are removed first", default=4096)
+    parser.add_argument("-dr", "--dry_run", action="store_true", help="list the files that would be sorted without moving them")
+    parser.add_argument("--metrics", metavar="metrics.jsonl", help="add the timings of each stage of each folder and FFMPEG's progress to this JSON lines file")
+    parser.add_argument("-pr", "--progress", action="store_true", help="show FFMPEG's progress while encoding")
+    parser.add_argument("--profile_stage", choices=StageMetrics.stages, help="run this stage under cProfile and save its stats to AnimatorOutput/profiles")
+    parser.add_argument("-j", "--jobs", metavar="4", help="amount of folders to encode at the same time", default=1)
+    parser.add_argument("-enc", "--encoder", choices=encoder_types, help="stream frames to FFMPEG through a pipe, or write a concat file list into the frame folder", default="pipe")
     args = parser.parse_args()
-    MLAnimator(args.dir, int(args.framerate), args.starting_frame, args.frames, args.filetype, not args.sort_only, args.reverse, args.mirror, args.info, args.all, Render_Frame_Text=args.rendertext)
+    MLAnimator(args.dir, int(args.framerate), args.starting_frame, args.frames, args.filetype, not args.sort_only, args.reverse, args.mirror, args.info, args.all, Render_Frame_Text=args.rendertext, jobs=int(args.jobs), encoder=args.encoder,
+               text_fields=[field.strip() for field in args.rendertext_fields.split(",")], save_text_frames=args.save_text_frames,
+               watch=args.watch, preview_frames=int(args.preview_frames), debounce=float(args.debounce), preview_interval=float(args.preview_interval), poll=args.poll, incremental=args.incremental, skip_unchanged=args.skip_unchanged, chunks=int(args.chunks), ranges=args.ranges,
+               frame_cache=args.frame_cache, cache_size=int(args.cache_size), dry_run=args.dry_run,
+               metrics=args.metrics, profile_stage=args.profile_stage, show_progress=args.progress, overwrite=args.overwrite,
+               dedup=args.dedup, target_frames=args.target_frames, prefetch=args.prefetch, prefetch_window=args.prefetch_window,
+               outputs=args.outputs, tile_width=args.tile_width, sheet_columns=args.sheet_columns, sheet_rows=args.sheet_rows,
+               sheet_step=args.sheet_step)
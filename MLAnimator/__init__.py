@@ -1 +1 @@
-from .MLAnimator import MLAnimator
+from .MLAnimator import MLAnimator, Animator, AnimationJob, AnimationResult, FrameSink
@@ -0,0 +1,159 @@
+# Times MLAnimator's main stages on synthetic output folders and reports the results as JSON.
+# FFMPEG is replaced with a stub that only reads its input unless --ffmpeg is given, so the stages around
+# the encode can be measured on machines without FFMPEG installed.
+#
+#   python benchmarks/run_benchmarks.py --prompts 8 --frames 500 --output results.json
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from os import chdir, chmod, environ, getcwd, mkdir, path, pathsep, scandir
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from MLAnimator.MLAnimator import MLAnimator, FrameFolder, FrameIndex, SortPlan
+from synthetic_tree import make_tree, styles
+
+# reads every frame piped to it and leaves an empty output file, like a very fast FFMPEG
+ffmpeg_stub = """#!%s
+import sys
+while sys.stdin.buffer.read(1 << 20):
+    pass
+open(sys.argv[-1], "wb").close()
+""" % sys.executable
+
+def install_ffmpeg_stub(bindir):
+    stubpath = path.join(bindir, "ffmpeg")
+    with open(stubpath, "w") as f:
+        f.write(ffmpeg_stub)
+    chmod(stubpath, 0o755)
+    environ["PATH"] = bindir + pathsep + environ.get("PATH", "")
+
+def timed(results, stage, items, repeat, setup, run):
+    # keeps the best of `repeat` runs, setup is run before every one of them and isn't timed
+    runs = []
+    for _ in range(repeat):
+        state = setup()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            run(state)
+            runs.append(time.perf_counter() - start)
+    best = min(runs)
+    results[stage] = {"seconds": best, "runs": runs, "items": items, "items_per_second": items / best if best else None}
+    print("%-22s %9.4fs  %10.1f items/s" % (stage, best, items / best if best else 0), file=sys.stderr)
+
+def run_benchmarks(args):
+    workdir = tempfile.mkdtemp(prefix="mlanimator_bench_")
+    startdir = getcwd()
+    results = {}
+    frames_total = args.prompts * args.frames
+
+    if args.ffmpeg:
+        ffmpeg = shutil.which("ffmpeg")
+        if ffmpeg is None:
+            sys.exit("--ffmpeg was given but FFMPEG isn't on the PATH")
+    else:
+        bindir = path.join(workdir, "bin")
+        mkdir(bindir)
+        install_ffmpeg_stub(bindir)
+        ffmpeg = "stub"
+
+    # AnimatorOutput is made in the current directory
+    chdir(workdir)
+    try:
+        count = [0]
+        def new_tree():
+            count[0] += 1
+            treedir = path.join(workdir, "run_%d" % count[0])
+            make_tree(treedir, args.prompts, args.frames, args.width, args.height, args.style, seed=args.seed)
+            return treedir
+
+        timed(results, "scan_index", frames_total, args.repeat, new_tree, lambda treedir: SortPlan(FrameIndex(treedir)))
+        timed(results, "sort", frames_total, args.repeat, new_tree,
+              lambda treedir: MLAnimator(treedir, 14, None, None, "mp4", False, False, False, False, True))
+
+        # the rest of the stages work on one sorted tree
+        treedir = path.join(workdir, "run_%d" % count[0])
+        with contextlib.redirect_stdout(io.StringIO()):
+            animator = MLAnimator(treedir, 14, None, None, "mp4", False, False, False, False, True)
+        folders = [f for f in scandir(treedir) if f.is_dir() and f.name != "Unsorted_Files"]
+
+        timed(results, "confirm_files", frames_total, args.repeat, lambda: None,
+              lambda _: [animator.confirm_files(f.path) for f in folders])
+
+        names = {f.name: animator.confirm_files(f.path) for f in folders}
+        timed(results, "order_get_file_num", frames_total, args.repeat, lambda: None,
+              lambda _: [sorted(files, key=lambda name: animator.get_file_num(name, len(files))) for files in names.values()])
+        timed(results, "order_frame_index", frames_total, args.repeat, lambda: None,
+              lambda _: [FrameFolder(f.path, f.name).files() for f in folders])
+
+        # frame selection in create_animation_file, the encode is left out and timed on its own below
+        encoder = animator.run_FFMPEG
+        def select(_):
+            animator.run_FFMPEG = lambda *a, **k: None
+            try:
+                for f in folders:
+                    animator.create_animation_file(folders, f.path, f.name, 14, None, "mp4", None, False, False,
+                                                   "bench_mp4_output", False, True, False, folder=FrameFolder(f.path, f.name))
+            finally:
+                animator.run_FFMPEG = encoder
+        timed(results, "select_frames", frames_total, args.repeat, lambda: None, select)
+
+        folder = FrameFolder(folders[0].path, folders[0].name)
+        files = folder.files()
+        entries = [(f, i, i + 1, True) for i, f in enumerate(files)]
+        def overlay(_):
+            for frame in animator.render_frame_text(entries, (args.width, args.height)):
+                pass
+        timed(results, "text_overlay", len(files), args.repeat, lambda: None, overlay)
+
+        outdir = path.join(workdir, "AnimatorOutput")
+        def encode(_):
+            animator.set_info(folder.name, 1, len(files), len(files))
+            animator.run_FFMPEG(files, folder.path, len(files), path.join(outdir, "bench_%d.%s" % (time.perf_counter_ns(), args.filetype)), 14, False)
+        timed(results, "encode", len(files), args.repeat, lambda: None, encode)
+
+    finally:
+        chdir(startdir)
+        if args.keep:
+            print("Benchmark files kept in %s" % workdir, file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "config": {"prompts": args.prompts, "frames": args.frames, "width": args.width, "height": args.height,
+                   "style": args.style, "filetype": args.filetype, "repeat": args.repeat, "seed": args.seed},
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "ffmpeg": ffmpeg,
+        "time": time.time(),
+        "results": results,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark MLAnimator's sorting, indexing, text overlay and encoding stages")
+    parser.add_argument("-p", "--prompts", metavar="4", type=int, help="amount of prompts in the synthetic folder", default=4)
+    parser.add_argument("-f", "--frames", metavar="200", type=int, help="frames per prompt", default=200)
+    parser.add_argument("--width", metavar="256", type=int, help="frame width", default=256)
+    parser.add_argument("--height", metavar="256", type=int, help="frame height", default=256)
+    parser.add_argument("--style", choices=sorted(styles), help="filename pattern of the synthetic frames", default="bigsleep")
+    parser.add_argument("-ft", "--filetype", metavar="mp4", help="output file type of the encode stage", default="mp4")
+    parser.add_argument("--repeat", metavar="3", type=int, help="runs of each stage, the fastest one is kept", default=3)
+    parser.add_argument("--seed", metavar="0", type=int, help="seed for the synthetic frames and prompt names", default=0)
+    parser.add_argument("--ffmpeg", action="store_true", help="use the real FFMPEG for the encode stage instead of the stub")
+    parser.add_argument("--keep", action="store_true", help="keep the synthetic folders and outputs")
+    parser.add_argument("-o", "--output", metavar="results.json", help="write the JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+    else:
+        print(json.dumps(report, indent=1))
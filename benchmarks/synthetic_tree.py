@@ -0,0 +1,62 @@
+# Makes unsorted output folders like the ones BigSleep, DeepDaze and VQGAN + CLIP leave behind, for benchmarking MLAnimator.
+# Every prompt gets a few distinct frames that are written over and over, so big trees can be made quickly.
+
+import argparse
+import io
+import random
+from os import makedirs, path
+from PIL import Image
+
+# filename patterns of each program's image output
+styles = {
+    "bigsleep": "{prompt}.{num}.png",
+    "deepdaze": "{prompt}.{num:06d}.png",
+    "vqgan": "{prompt}.{num:04d}.png",
+}
+
+prompt_words = ["a", "painting", "of", "the", "ocean", "city", "forest", "at", "night", "sunrise", "in", "space", "dream"]
+
+def make_frames(width, height, variants, seed):
+    rng = random.Random(seed)
+    frames = []
+    for _ in range(variants):
+        color = tuple(rng.randrange(256) for _ in range(3))
+        img = Image.effect_noise((width, height), 40).convert("RGB")
+        img = Image.blend(img, Image.new("RGB", (width, height), color), 0.6)
+        data = io.BytesIO()
+        img.save(data, "PNG")
+        frames.append(data.getvalue())
+    return frames
+
+def make_tree(dir, prompts=4, frames=200, width=256, height=256, style="bigsleep", misc=2, seed=0):
+    # returns the prompt names, each with `frames` numbered frames, plus `misc` images that don't belong to any prompt
+    rng = random.Random(seed)
+    pattern = styles[style]
+    makedirs(dir, exist_ok=True)
+
+    names = []
+    for p in range(prompts):
+        name = "_".join(rng.choice(prompt_words) for _ in range(4)) + "_%d" % p
+        names.append(name)
+        variants = make_frames(width, height, 8, seed + p)
+        for num in range(1, frames + 1):
+            with open(path.join(dir, pattern.format(prompt=name, num=num)), "wb") as f:
+                f.write(variants[num % len(variants)])
+
+    variants = make_frames(width, height, 1, seed - 1)
+    for m in range(misc):
+        with open(path.join(dir, "progress_%d.png" % m if m else "progress.png"), "wb") as f:
+            f.write(variants[0])
+
+    return names
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Make a synthetic unsorted output folder of ML image frames")
+    parser.add_argument("-dir", "--dir", metavar="./dir/path", help="folder to write the frames to", required=True)
+    parser.add_argument("-p", "--prompts", metavar="4", help="amount of prompts", default=4)
+    parser.add_argument("-f", "--frames", metavar="200", help="frames per prompt", default=200)
+    parser.add_argument("--width", metavar="256", help="frame width", default=256)
+    parser.add_argument("--height", metavar="256", help="frame height", default=256)
+    parser.add_argument("--style", choices=sorted(styles), help="filename pattern to use", default="bigsleep")
+    args = parser.parse_args()
+    make_tree(args.dir, int(args.prompts), int(args.frames), int(args.width), int(args.height), args.style)